@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
+import json
 # Base Model
 
 
@@ -45,6 +46,8 @@ class ReservationRequest(BaseModel):
     room_type: Optional[str] = None
     payment_method: Optional[str] = None
     card_id: Optional[str] = None
+    doctor_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
 
 
 class PaymentRequest(BaseModel):
@@ -53,3 +56,94 @@ class PaymentRequest(BaseModel):
     use_cp: bool = False
     use_rw_card: bool = False
     money: float | None = None
+    idempotency_key: str | None = None
+
+
+class SplitPaymentRequest(BaseModel):
+    # ตัดบัตรตามลำดับ card_IDs (ว่าง = ทุกใบของลูกค้า) ส่วนที่เหลือจ่ายด้วย QR ด้วยยอด qr_money
+    card_IDs: list[str] = []
+    use_cp: bool = False
+    use_rw_card: bool = False
+    qr_money: float | None = None
+    idempotency_key: str | None = None
+
+
+class ComboReservationItem(BaseModel):
+    service_type: str
+    datetime_start_str: str
+    datetime_end_str: Optional[str] = None
+    room_type: Optional[str] = None
+    doctor_id: Optional[str] = None
+
+
+class ComboReservationRequest(BaseModel):
+    customer_id: str
+    pet_id: str
+    items: list[ComboReservationItem] = []
+    payment_method: Optional[str] = None
+    card_id: Optional[str] = None
+
+
+# ใบเสร็จ เปลี่ยนโครงสร้างเมื่อไหร่ให้เพิ่มเลข version
+# 2: เพิ่ม tenders (จ่ายด้วยอะไรเท่าไหร่) ท้าย array
+ReceiptSchemaVersion = 2
+
+
+class ReceiptPetService(BaseModel):
+    pet_name: str
+    services: list[str] = []
+
+
+class ReceiptTender(BaseModel):
+    payment_type: str
+    card_id: Optional[str] = None
+    price_satang: int
+    price: float
+
+
+class PaymentReceipt(BaseModel):
+    schema_version: int = ReceiptSchemaVersion
+    payment_id: str
+    customer_id: str
+    kind: str
+    payment_type: str
+    card_id: Optional[str] = None
+    price_satang: int
+    price: float
+    point: int = 0
+    date: str
+    pet_services: list[ReceiptPetService] = []
+    tenders: list[ReceiptTender] = []
+
+    # แบบย่อ: JSON array เรียงตามลำดับ field ไม่มีชื่อ key
+    # [version, payment_id, customer_id, kind, payment_type, card_id, price_satang, point, date,
+    #  [[pet_name, [services]]], [[payment_type, card_id, price_satang]]]
+    @classmethod
+    def from_compact(cls, data: str):
+        row = json.loads(data)
+        if row[0] not in (1, ReceiptSchemaVersion):
+            raise ValueError(f"Unsupported receipt schema version: {row[0]}")
+        tenders = []
+        if row[0] >= 2:
+            tenders = [
+                ReceiptTender(payment_type=payment_type, card_id=card_id,
+                              price_satang=satang, price=satang / 100)
+                for payment_type, card_id, satang in row[10]
+            ]
+        return cls(
+            schema_version=row[0],
+            payment_id=row[1],
+            customer_id=row[2],
+            kind=row[3],
+            payment_type=row[4],
+            card_id=row[5],
+            price_satang=row[6],
+            price=row[6] / 100,
+            point=row[7],
+            date=row[8],
+            pet_services=[
+                ReceiptPetService(pet_name=pet_name, services=services)
+                for pet_name, services in row[9]
+            ],
+            tenders=tenders,
+        )
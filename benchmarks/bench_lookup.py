@@ -0,0 +1,62 @@
+# เวลาค้นหาลูกค้า/pet ตาม ID ต้องคงที่ไม่ว่าจะมีลูกค้ากี่คน
+# รัน: python benchmarks/bench_lookup.py
+import io
+import random
+import sys
+import timeit
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from system_class import Clinic, Customer, Pet  # noqa: E402
+
+Lookups = 20000
+ScanLookups = 200  # แบบเดิมไล่ list ทีละตัว ช้ามาก วัดแค่นี้พอ
+
+
+def build_clinic(count):
+    with redirect_stdout(io.StringIO()):
+        clinic = Clinic()
+    for i in range(count):
+        customer = Customer(f"BC{i}", f"Customer {i}", "0800000000", f"c{i}@mail.com")
+        pet = Pet(f"BP{i}", f"Pet {i}", "Dog", "Mixed", 10, customer.id)
+        customer.add_pet(pet)
+        clinic.add_customer(customer)
+        clinic.add_pet(pet)
+    return clinic
+
+
+def time_lookup(lookup, ids):
+    def run():
+        for item_id in ids:
+            lookup(item_id)
+    return min(timeit.repeat(run, number=1, repeat=5)) / len(ids)
+
+
+def linear_scan(customers):
+    # วิธีเดิมก่อนมี dict ไว้เทียบ
+    def lookup(customer_id):
+        for customer in customers:
+            if customer.id == customer_id:
+                return customer
+        return None
+    return lookup
+
+
+def main():
+    rng = random.Random(1)
+    print(f"{'customers':>9} {'get_customer_info ns':>21} {'get_pet_info ns':>16} {'linear scan ns':>15}")
+    for count in (1_000, 10_000, 100_000):
+        clinic = build_clinic(count)
+        customer_ids = [f"BC{rng.randrange(count)}" for _ in range(Lookups)]
+        pet_ids = [f"BP{rng.randrange(count)}" for _ in range(Lookups)]
+        customer_ns = time_lookup(clinic.get_customer_info, customer_ids) * 1e9
+        pet_ns = time_lookup(clinic.get_pet_info, pet_ids) * 1e9
+        customers = [clinic.get_customer_info(f"BC{i}") for i in range(count)]
+        scan_ns = time_lookup(linear_scan(customers), customer_ids[:ScanLookups]) * 1e9
+        print(f"{count:>9} {customer_ns:>21.0f} {pet_ns:>16.0f} {scan_ns:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# เทียบความเร็ว check_availability ระหว่าง calendar mode กับการเทียบ tuple
+# รัน: python benchmarks/bench_time_schedule.py
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from system_class import TimeSchedule  # noqa: E402
+
+Base = datetime(2030, 1, 1)
+Queries = 2000
+
+
+def build(capacity, slot_minutes, bookings, rng):
+    # นัดตรงช่อง 15 นาที กระจายทั้งปี เหมือนตารางหมอ/ห้องที่ใช้งานจริง
+    schedule = TimeSchedule(capacity, slot_minutes=slot_minutes)
+    for start, length in bookings:
+        schedule.add_schedule(start, start + length)
+    return schedule
+
+
+def make_bookings(count, rng):
+    bookings = []
+    for _ in range(count):
+        start = Base + timedelta(minutes=15 * rng.randint(0, 365 * 96))
+        bookings.append((start, timedelta(minutes=15 * rng.randint(1, 8))))
+    return bookings
+
+
+def make_queries(rng):
+    queries = []
+    for _ in range(Queries):
+        start = Base + timedelta(minutes=15 * rng.randint(0, 365 * 96))
+        queries.append((start, start + timedelta(minutes=15 * rng.randint(1, 8))))
+    return queries
+
+
+def time_check(schedule, queries):
+    def run():
+        for start, end in queries:
+            schedule.check_availability(start, end)
+    return min(timeit.repeat(run, number=1, repeat=5)) / len(queries)
+
+
+def main():
+    rng = random.Random(1)
+    queries = make_queries(rng)
+    print(f"{'capacity':>8} {'bookings':>9} {'tuple us':>9} {'calendar us':>12} {'speedup':>8}")
+    for capacity in (1, 10):
+        for count in (1_000, 10_000, 50_000):
+            bookings = make_bookings(count, rng)
+            exact = build(capacity, None, bookings, rng)
+            calendar = build(capacity, 15, bookings, rng)
+            exact_us = time_check(exact, queries) * 1e6
+            calendar_us = time_check(calendar, queries) * 1e6
+            print(f"{capacity:>8} {count:>9} {exact_us:>9.2f} {calendar_us:>12.2f} {exact_us / calendar_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+from functools import total_ordering
+
+
+@total_ordering
+class Money:
+    # เก็บเงินเป็นจำนวนเต็มหน่วยสตางค์ บวกลบคูณไม่มีเศษทศนิยมสะสม
+    # แปลงเป็นบาท (ตัวเลข JSON) เฉพาะตอนรับ/ส่งข้อมูลออกนอกระบบ
+    __slots__ = ("__satang",)
+    SatangPerBaht = 100
+    BasisPoint = 10000  # อัตรา 1% = 100 basis points
+
+    def __init__(self, satang=0):
+        if isinstance(satang, bool) or not isinstance(satang, int):
+            raise TypeError("Money must be created from integer satang")
+        self.__satang = satang
+
+    @classmethod
+    def from_baht(cls, baht):
+        if isinstance(baht, Money):
+            return baht
+        if isinstance(baht, bool):
+            raise TypeError("Money amount must be a number")
+        try:
+            satang = Decimal(str(baht)) * cls.SatangPerBaht
+            return cls(int(satang.quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"Invalid money amount: {baht}")
+
+    @staticmethod
+    def rate_to_basis_points(rate):
+        # 0.05 -> 500
+        return int((Decimal(str(rate)) * Money.BasisPoint).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    @property
+    def satang(self):
+        return self.__satang
+
+    def to_baht(self):
+        # บาทเต็มคืน int ไม่งั้นคืน float 2 ตำแหน่ง
+        baht, satang = divmod(self.__satang, self.SatangPerBaht)
+        if satang == 0:
+            return baht
+        return self.__satang / self.SatangPerBaht
+
+    def apply_rate(self, basis_points):
+        # ปัดครึ่งขึ้นเป็นสตางค์ที่ใกล้ที่สุด
+        sign = -1 if self.__satang < 0 else 1
+        amount = (abs(self.__satang) * basis_points * 2 + self.BasisPoint) // (self.BasisPoint * 2)
+        return Money(sign * amount)
+
+    def __add__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.__satang + other.satang)
+
+    def __sub__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return Money(self.__satang - other.satang)
+
+    def __mul__(self, times):
+        if isinstance(times, bool) or not isinstance(times, int):
+            return NotImplemented
+        return Money(self.__satang * times)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.__satang)
+
+    def __eq__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.__satang == other.satang
+
+    def __lt__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.__satang < other.satang
+
+    def __hash__(self):
+        return hash(self.__satang)
+
+    def __bool__(self):
+        return self.__satang != 0
+
+    def __str__(self):
+        baht, satang = divmod(abs(self.__satang), self.SatangPerBaht)
+        sign = "-" if self.__satang < 0 else ""
+        if satang == 0:
+            return f"{sign}{baht}"
+        return f"{sign}{baht}.{satang:02d}"
+
+    def __repr__(self):
+        return f"Money({self.__satang})"
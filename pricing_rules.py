@@ -0,0 +1,230 @@
+import bisect
+import json
+import os
+import threading
+import time
+from money import Money
+
+# ไฟล์ราคาอยู่ข้างๆ โค้ด แก้ไฟล์แล้วระบบจะโหลดใหม่เองไม่ต้อง restart
+DefaultPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pricing_rules.json")
+
+# ใช้ตอนไม่มีไฟล์ หรือไฟล์ไม่ได้ใส่บาง section มา
+DefaultRules = {
+    "grooming": {
+        "base_price": 2000,
+        "aggressive_surcharge": 500,
+    },
+    "room_price_per_day": {
+        "privateroom": 1500,
+        "shareroom": 500,
+    },
+    "tier_discount_rate": {
+        "silver": 0.01,
+        "gold": 0.05,
+        "platinum": 0.1,
+    },
+    "coupon": {
+        "discount": 10,
+        "point_cost": 50,
+    },
+    "point_rate": 0.01,
+    # ราคาโรงแรมตามจำนวนห้องที่ถูกจองในคืนนั้น (occupancy = จองแล้ว / ความจุทั้งหมดของประเภทห้อง)
+    # ใช้ multiplier ของขั้นแรกที่ max_occupancy >= occupancy
+    "hotel_dynamic_pricing": {
+        "enabled": False,
+        "tiers": [
+            {"max_occupancy": 0.5, "multiplier": 1.0},
+            {"max_occupancy": 0.8, "multiplier": 1.2},
+            {"max_occupancy": 1.0, "multiplier": 1.5},
+        ],
+    },
+}
+
+
+class PricingRules:
+    # เช็คว่าไฟล์เปลี่ยนหรือยังไม่เกินทุกกี่วินาที กัน os.stat ทุกครั้งที่คิดราคา
+    CheckInterval = 2
+
+    def __init__(self, path=DefaultPath):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__mtime = None
+        self.__last_check = 0
+        self.__version = 0
+        self.__table = self.compile(DefaultRules)
+        self.reload()
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def version(self):
+        # เพิ่มทุกครั้งที่โหลดราคาใหม่ ใช้เป็นส่วนหนึ่งของ key cache ยอดที่ต้องจ่าย
+        return self.__version
+
+    @staticmethod
+    def compile(rules):
+        # แปลง config เป็นตารางแบน key -> ค่า ตอนคิดราคาจะได้ lookup ครั้งเดียว
+        # ราคาในไฟล์เป็นบาท แปลงเป็น Money, อัตราแปลงเป็น basis points
+        merged = {}
+        for section, default in DefaultRules.items():
+            value = rules.get(section, default)
+            if isinstance(default, dict):
+                if not isinstance(value, dict):
+                    raise ValueError(f"'{section}' must be an object")
+                value = {**default, **value}
+            merged[section] = value
+
+        table = {}
+        grooming = merged["grooming"]
+        table[("grooming", False)] = grooming["base_price"]
+        table[("grooming", True)] = grooming["base_price"] + grooming["aggressive_surcharge"]
+        for room_type, price in merged["room_price_per_day"].items():
+            table[("room", room_type.lower())] = price
+        for tier, rate in merged["tier_discount_rate"].items():
+            if not 0 <= rate <= 1:
+                raise ValueError(f"discount rate of '{tier}' must be between 0 and 1")
+            table[("tier", tier.lower())] = rate
+        table["coupon_discount"] = merged["coupon"]["discount"]
+        table["coupon_point_cost"] = merged["coupon"]["point_cost"]
+        table["point_rate"] = merged["point_rate"]
+        dynamic = PricingRules.compile_hotel_dynamic_pricing(
+            merged["hotel_dynamic_pricing"])
+
+        for key, value in table.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"{key} must be a number that is not negative")
+
+        for key, value in table.items():
+            if key == "coupon_point_cost":
+                table[key] = int(value)
+            elif key == "point_rate" or key[0] == "tier":
+                table[key] = Money.rate_to_basis_points(value)
+            else:
+                table[key] = Money.from_baht(value)
+        table["hotel_dynamic"] = dynamic
+        return table
+
+    @staticmethod
+    def compile_hotel_dynamic_pricing(config):
+        # คืน (enabled, [max_occupancy bp เรียงน้อยไปมาก], [multiplier bp])
+        tiers = config["tiers"]
+        if not isinstance(tiers, list) or len(tiers) == 0:
+            raise ValueError("hotel_dynamic_pricing.tiers must be a non-empty list")
+        tiers = sorted(tiers, key=lambda tier: tier["max_occupancy"])
+        thresholds = []
+        multipliers = []
+        for tier in tiers:
+            max_occupancy = tier["max_occupancy"]
+            multiplier = tier["multiplier"]
+            for value in (max_occupancy, multiplier):
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                    raise ValueError("hotel_dynamic_pricing tiers must be numbers that are not negative")
+            thresholds.append(Money.rate_to_basis_points(max_occupancy))
+            multipliers.append(Money.rate_to_basis_points(multiplier))
+        if thresholds[-1] < Money.BasisPoint:
+            raise ValueError("the last hotel_dynamic_pricing tier must cover max_occupancy 1.0")
+        return bool(config["enabled"]), thresholds, multipliers
+
+    def reload(self):
+        # โหลดไม่ผ่านให้ใช้ตารางเดิมต่อ ราคาจะไม่หายกลางคัน
+        with self.__lock:
+            self.__last_check = time.monotonic()
+            try:
+                mtime = os.stat(self.__path).st_mtime
+            except OSError:
+                return {"status": "fail", "message": f"Pricing file not found: {self.__path}"}
+            try:
+                with open(self.__path, encoding="utf-8") as file:
+                    rules = json.load(file)
+                if not isinstance(rules, dict):
+                    raise ValueError("pricing file must be a JSON object")
+                table = self.compile(rules)
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                self.__mtime = mtime
+                return {"status": "fail", "message": f"Invalid pricing file: {error}"}
+            self.__mtime = mtime
+            self.__table = table
+            self.__version += 1
+            return {"status": "success", "version": self.__version}
+
+    def reload_if_changed(self):
+        if time.monotonic() - self.__last_check < self.CheckInterval:
+            return False
+        try:
+            mtime = os.stat(self.__path).st_mtime
+        except OSError:
+            self.__last_check = time.monotonic()
+            return False
+        if mtime == self.__mtime:
+            self.__last_check = time.monotonic()
+            return False
+        return self.reload()["status"] == "success"
+
+    def get_rules(self):
+        rules = {
+            "grooming": {},
+            "room_price_per_day": {},
+            "tier_discount_rate": {},
+        }
+        table = self.__table
+        for key, value in table.items():
+            if key == "hotel_dynamic":
+                enabled, thresholds, multipliers = value
+                rules["hotel_dynamic_pricing"] = {
+                    "enabled": enabled,
+                    "tiers": [
+                        {"max_occupancy": threshold / Money.BasisPoint,
+                         "multiplier": multiplier / Money.BasisPoint}
+                        for threshold, multiplier in zip(thresholds, multipliers)
+                    ],
+                }
+                continue
+            if isinstance(value, Money):
+                value = value.to_baht()
+            elif key == "point_rate" or key[0] == "tier":
+                value = value / Money.BasisPoint
+            if key == ("grooming", False):
+                rules["grooming"]["base_price"] = value
+            elif key == ("grooming", True):
+                rules["grooming"]["aggressive_price"] = value
+            elif key[0] == "room":
+                rules["room_price_per_day"][key[1]] = value
+            elif key[0] == "tier":
+                rules["tier_discount_rate"][key[1]] = value
+            else:
+                rules[key] = value
+        return rules
+
+    def grooming_price(self, aggressive=False):
+        return self.__table[("grooming", bool(aggressive))]
+
+    def room_price(self, room_type):
+        return self.__table[("room", room_type)]
+
+    # อัตราคืนเป็น basis points ใช้กับ Money.apply_rate
+    def tier_rate(self, tier):
+        return self.__table.get(("tier", tier), 0)
+
+    def coupon_discount(self):
+        return self.__table["coupon_discount"]
+
+    def coupon_point_cost(self):
+        return self.__table["coupon_point_cost"]
+
+    def point_rate(self):
+        return self.__table["point_rate"]
+
+    def hotel_dynamic_pricing(self):
+        return self.__table["hotel_dynamic"][0]
+
+    def hotel_night_multiplier(self, booked, capacity):
+        # booked/capacity -> multiplier (basis points) ไม่ได้เปิดโหมดนี้ = ราคาปกติ
+        enabled, thresholds, multipliers = self.__table["hotel_dynamic"]
+        if not enabled or capacity <= 0:
+            return Money.BasisPoint
+        # ปัดขึ้น เกิน threshold นิดเดียวก็ขึ้นขั้นถัดไป
+        occupancy = -(-min(booked, capacity) * Money.BasisPoint // capacity)
+        index = bisect.bisect_left(thresholds, occupancy)
+        return multipliers[min(index, len(multipliers) - 1)]
@@ -21,6 +21,27 @@ def add_card_information(customer_id: str, money: float):
     return result
 
 
+@mcp.tool()
+def top_up_card(customer_id: str, card_id: str, money: float):
+    """deposit money into a card the customer already registered"""
+    result = clinic_sys.deposit_to_card(customer_id, card_id, money)
+    return result
+
+
+@mcp.tool()
+def card_balance(customer_id: str, card_id: str, datetime_str: str = None):
+    """show card balance now, or at a past time if datetime_str is given. datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.get_card_balance(customer_id, card_id, datetime_str)
+    return result
+
+
+@mcp.tool()
+def clinic_revenue(datetime_start_str: str, datetime_end_str: str):
+    """show clinic revenue (service payments, prepaid hotel, refunds) between two times. datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.get_revenue(datetime_start_str, datetime_end_str)
+    return result
+
+
 @mcp.tool()
 def make_register(data: RegisterRequest):
     """register customer information"""
@@ -45,9 +66,12 @@ def make_reservation(
     room_type: Literal["PrivateRoom", "ShareRoom"] = None,
     payment_method: Literal["card", "qrcode"] = None,
     card_id: str = None,
-    money: float = None
+    money: float = None,
+    doctor_id: str = None,
+    join_waitlist: bool = False,
+    idempotency_key: str = None
 ):
-    """make a reservation. datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    """make a reservation. datetime format strictly 'YYYY-MM-DD HH:MM'. doctor_id is an optional preferred doctor for Medical (falls back to the least busy doctor). if nothing is free the reply has suggestions; set join_waitlist=true only if the customer wants to wait for this exact time instead (it is booked automatically when a slot frees up, and Hotel is paid with the given payment method at that moment). send a unique idempotency_key and reuse it when retrying so the booking and payment happen only once"""
     try:
         datetime.strptime(datetime_start_str, "%Y-%m-%d %H:%M")
         if datetime_end_str:
@@ -63,10 +87,58 @@ def make_reservation(
 
     return clinic_sys.create_reservation(
         customer_id, pet_id, service_type, datetime_start_str,
-        datetime_end_str, room_type, payment_method, card_id
+        datetime_end_str, room_type, payment_method, card_id,
+        doctor_id=doctor_id,
+        join_waitlist=join_waitlist,
+        idempotency_key=idempotency_key
     )
 
 
+@mcp.tool()
+def make_combo_reservation(data: ComboReservationRequest):
+    """book several services (Grooming / Medical / Hotel) for one pet in one call. all or nothing, hotel is prepaid once. datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.create_combo_reservation(data)
+    return result
+
+
+@mcp.tool()
+def search_available_rooms(
+    datetime_start_str: str,
+    datetime_end_str: str,
+    room_type: Literal["PrivateRoom", "ShareRoom"] = None
+):
+    """search free hotel rooms and remaining capacity in a date range. datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.search_available_rooms(
+        datetime_start_str, datetime_end_str, room_type)
+    return result
+
+
+@mcp.tool()
+def quote_hotel_price(
+    datetime_start_str: str,
+    datetime_end_str: str,
+    room_type: Literal["PrivateRoom", "ShareRoom"]
+):
+    """show hotel price per night before booking. when dynamic pricing is on, busier nights cost more. datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.quote_hotel_price(
+        datetime_start_str, datetime_end_str, room_type)
+    return result
+
+
+@mcp.tool()
+def find_available_slots(
+    service_type: Literal["Hotel", "Medical", "Grooming"],
+    datetime_start_str: str,
+    datetime_end_str: str = None,
+    room_type: Literal["PrivateRoom", "ShareRoom"] = None,
+    count: int = 3
+):
+    """find the next free time slots after datetime_start_str (same length as the requested booking). datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.find_available_slots(
+        service_type, datetime_start_str, datetime_end_str, room_type, count)
+    return result
+
+
 @mcp.tool()
 def get_all_reservations(customer_id: str):
     """show detail of all reservation that customer have"""
@@ -74,6 +146,16 @@ def get_all_reservations(customer_id: str):
     return result
 
 
+@mcp.tool()
+def prune_expired_schedule():
+    """move finished bookings out of live schedules and reservations, show how many were pruned"""
+    pruned = clinic_sys.prune_expired()
+    return {
+        "pruned": pruned,
+        "total": clinic_sys.get_prune_metrics()
+    }
+
+
 @mcp.tool()
 def get_all_notification(customer_id: str):
     """show detail of all notification that customer have"""
@@ -91,6 +173,13 @@ def cancel_reservation(customer_id: str, pet_id: str, reservation_id: str):
     return result
 
 
+@mcp.tool()
+def leave_waitlist(customer_id: str, waitlist_id: str):
+    """remove a waiting request (waitlist_id from a failed make_reservation) so it will not be booked automatically"""
+    result = clinic_sys.leave_waitlist(customer_id, waitlist_id)
+    return result
+
+
 @mcp.tool()
 def calculate_price(
     customer_id: str,
@@ -104,57 +193,70 @@ def calculate_price(
 
 
 @mcp.tool()
-def check_pet_services(pet_id: str):
-    """check all service and price but not use discount yet"""
-    pet = clinic_sys.get_pet_info(pet_id)
-    if not pet:
-        return {"status": "fail", "message": "Pet not found"}
-
-    service_history = []
-
-    for idx, big_service in enumerate(pet.service):
-        current_total_price = big_service.calculate_total_price()
-        service_date = big_service.get_date
-        if isinstance(service_date, datetime):
-            formatted_date = service_date.strftime("%Y-%m-%d %H:%M")
-        else:
-            formatted_date = str(service_date)
+def end_of_day_quotes(cursor: str = None, limit: int = 50):
+    """closing time summary: discounted total of every customer who still has unpaid services, one page at a time. pass next_cursor from the previous page to continue"""
+    result = clinic_sys.get_open_bill_quotes(cursor, limit)
+    return result
 
-        service_history.append({
-            "bill_no": idx + 1,
-            "date_created": formatted_date,
-            "is_paid": big_service.is_paid,
-            "services_inside": big_service.get_service_list(),
-            "total_price_to_pay_now": current_total_price
-        })
 
-    return {
-        "status": "success(Found)",
-        "pet_id": pet.id,
-        "pet_name": pet.name,
-        "total_service_boxes": len(pet.service),
-        "history": service_history
-    }
+@mcp.tool()
+def check_pet_services(
+    pet_id: str,
+    cursor: str = None,
+    limit: int = 20,
+    datetime_start_str: str = None,
+    datetime_end_str: str = None
+):
+    """check service bills and price (discount not used yet), oldest first, one page at a time. pass next_cursor from the previous page to continue. optional date range (end not included), datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.get_pet_bill_page(
+        pet_id, cursor, limit, datetime_start_str, datetime_end_str)
+    return result
 
 
 @mcp.tool()
 def payment(customer_id: str, req: PaymentRequest):
-    """start to pay after make service"""
+    """start to pay after make service, returns the receipt. reuse the same req.idempotency_key when retrying so the customer is charged only once"""
     result = clinic_sys.start_payment(
         customer_id,
         req.payment_type,
         req.card_ID,
         req.use_cp,
         req.use_rw_card,
-        req.money
+        req.money,
+        req.idempotency_key
+    )
+    if isinstance(result, str):
+        return {"status": "fail", "message": result}
+    return {"status": "success", "receipt": result}
+
+
+@mcp.tool()
+def split_payment(customer_id: str, req: SplitPaymentRequest):
+    """pay one bill with several cards (in req.card_IDs order, empty = all cards) and pay what the cards cannot cover by QR (req.qr_money must equal that remainder). all cards are charged together or none are"""
+    result = clinic_sys.start_split_payment(
+        customer_id,
+        req.card_IDs,
+        req.use_cp,
+        req.use_rw_card,
+        req.qr_money,
+        req.idempotency_key
     )
-    return (result)
+    if isinstance(result, str):
+        return {"status": "fail", "message": result}
+    return {"status": "success", "receipt": result}
 
 
 @mcp.tool()
-def record_grooming_service(customer_id: str, pet_id: str):
-    """make grooming service after reservation or walkin"""
-    result = clinic_sys.record_service(customer_id, pet_id)
+def export_receipts(datetime_start_str: str = None, datetime_end_str: str = None):
+    """export payment receipts in a time range for archiving, one compact JSON array per line (see schema_version). datetime format strictly 'YYYY-MM-DD HH:MM'"""
+    result = clinic_sys.export_receipts(datetime_start_str, datetime_end_str)
+    return result
+
+
+@mcp.tool()
+def record_grooming_service(customer_id: str, pet_id: str, groomer_id: str = None):
+    """make grooming service after reservation or walkin. walk-in uses groomer_id if free, otherwise the least busy groomer"""
+    result = clinic_sys.record_service(customer_id, pet_id, groomer_id)
     return result
 
 
@@ -189,6 +291,13 @@ async def add_admit(data: AdmitRequest):
     return admit
 
 
+@mcp.tool()
+def reload_pricing_rules():
+    """reload prices (grooming, room, tier discount, coupon, point, hotel dynamic pricing) from pricing_rules.json right now and show the prices in use"""
+    result = clinic_sys.reload_pricing_rules()
+    return result
+
+
 @mcp.tool()
 def show_all_point_in_account(customer_id: str):
     """show all point in member by customer_id"""
@@ -197,9 +306,9 @@ def show_all_point_in_account(customer_id: str):
 
 
 @mcp.tool()
-def exchage_coupon(customer_id: str):
-    """exchange point to coupon"""
-    result = clinic_sys.point_to_coupon(customer_id)
+def exchage_coupon(customer_id: str, count: int | Literal["max"] = 1):
+    """exchange point to coupon. count = how many coupons, or "max" for as many as the points can pay for. all coupons are exchanged together or none are"""
+    result = clinic_sys.exchange_coupons(customer_id, count)
     return result
 
 
@@ -1,8 +1,15 @@
 import uuid
+import bisect
+import heapq
+import threading
+from collections import deque, OrderedDict
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 import math
+import json
 from base_model_class import *
+from pricing_rules import PricingRules
+from money import Money
 
 
 class Notification:
@@ -24,13 +31,19 @@ class Notification:
 
 
 class Reservation(ABC):
+    Type = None
+
     def __init__(self, reservation_id, customer, pet, time):
         self.reservation_id = reservation_id
         self.customer = customer
         self.pet = pet
         self.time = time
+        self.time_end = time
         self.status = "confirmed"
 
+    def is_expired(self, now: datetime):
+        return self.time_end <= now
+
     @abstractmethod
     def get_details(self):
         pass
@@ -41,14 +54,28 @@ class Reservation(ABC):
 
 
 class GroomingReservation(Reservation):
-    def __init__(self, reservation_id, customer, pet, time):
-        super().__init__(reservation_id, customer, pet, time)
+    Type = "Grooming"
+
+    def __init__(self, reservation_id, customer, pet, time_start, time_end, groomer):
+        super().__init__(reservation_id, customer, pet, time_start)
+        self.time_end = time_end
+        self.__groomer = groomer
+
+    @property
+    def groomer(self):
+        return self.__groomer
+
+    @property
+    def get_time_start_and_end(self):
+        return self.time, self.time_end
 
     def get_details(self):
-        return f"[Grooming Reservation] for {self.pet.name}"
+        return f"[Grooming Reservation] with {self.__groomer.name} for {self.pet.name}"
 
 
 class MedicalReservation(Reservation):
+    Type = "Medical"
+
     def __init__(self, reservation_id, customer, pet, time_start, time_end, doctor):
         super().__init__(reservation_id, customer, pet, time_start)
         self.time_end = time_end
@@ -67,6 +94,8 @@ class MedicalReservation(Reservation):
 
 
 class HotelReservation(Reservation):
+    Type = "Hotel"
+
     def __init__(self, reservation_id, customer, pet, time_start, time_end, room, total_price, payment):
         super().__init__(reservation_id, customer, pet, time_start)
         self.time_end = time_end
@@ -101,7 +130,7 @@ class Card(PaymentMethod):
     def __init__(self, card_id):
         self.__card_id = card_id
         self.__payment_type = "card"
-        self.__total_money = 0
+        self.__total_money = Money(0)
 
     def validate_money(self, total_price, money=None):
         if self.__total_money >= total_price:
@@ -132,7 +161,7 @@ class Card(PaymentMethod):
 class QRCode(PaymentMethod):
     def __init__(self, id):
         self.__payment_type = "qrcode"
-        self.__total_money = 0
+        self.__total_money = Money(0)
         self.__qrcodeID = id
 
     def validate_money(self, total_price, money):
@@ -147,28 +176,264 @@ class QRCode(PaymentMethod):
 
 
 class Payment:
-    def __init__(self, customer_id, payment_ID, method, price, pet_service_list, date, point):
+    def __init__(self, customer_id, payment_ID, method, price, pet_service_list, date, point, kind="charge", tenders=None):
         self.__customer_id = customer_id
         self.__payment_id = payment_ID
-        self.__payment_type = method.get_payment_type
+        # tenders: [(payment_type, card_id, Money)] จ่ายแบบแยกหลายช่องทางส่ง method เป็น None
+        if tenders == None:
+            card_id = method.get_id if isinstance(method, Card) else None
+            tenders = [(method.get_payment_type, card_id, price)]
+        if method == None:
+            if len(tenders) == 1:
+                self.__payment_type, self.__card_id, _ = tenders[0]
+            else:
+                self.__payment_type = "split"
+                self.__card_id = None
+        else:
+            self.__payment_type = method.get_payment_type
+            self.__card_id = method.get_id if isinstance(method, Card) else None
+        self.__tenders = tenders
         self.__price = price
+        # [[ชื่อ pet, [service, ...]], ...]
         self.__pet_service_list = pet_service_list
+        if isinstance(date, datetime):
+            date = date.strftime("%Y-%m-%d %H:%M:%S")
         self.__date = date
         self.__point = point
+        self.__kind = kind
+        self.__compact = None
         # self.__payment_method = []
 
+    @property
+    def payment_id(self):
+        return self.__payment_id
+
+    @property
+    def price(self):
+        return self.__price
+
     def create_payment_slip(self):
         return f"CustomerID:{self.__customer_id}-PaymentID:{self.__payment_id}-Type:{self.__payment_type}-Price:{self.__price}-Pet_Service:{self.__pet_service_list}-Date:{self.__date}-Point:{self.__point}"
 
+    def create_receipt(self):
+        return PaymentReceipt(
+            payment_id=self.__payment_id,
+            customer_id=self.__customer_id,
+            kind=self.__kind,
+            payment_type=self.__payment_type,
+            card_id=self.__card_id,
+            price_satang=self.__price.satang,
+            price=self.__price.to_baht(),
+            point=self.__point,
+            date=self.__date,
+            pet_services=[
+                ReceiptPetService(pet_name=pet_name, services=services)
+                for pet_name, services in self.__pet_service_list
+            ],
+            tenders=[
+                ReceiptTender(payment_type=payment_type, card_id=card_id,
+                              price_satang=amount.satang, price=amount.to_baht())
+                for payment_type, card_id, amount in self.__tenders
+            ],
+        )
+
+    def to_compact(self):
+        # Payment แก้ไม่ได้หลังสร้าง เข้ารหัสครั้งเดียวแล้วเก็บไว้ export ซ้ำได้เลย
+        if self.__compact == None:
+            self.__compact = json.dumps([
+                ReceiptSchemaVersion,
+                self.__payment_id,
+                self.__customer_id,
+                self.__kind,
+                self.__payment_type,
+                self.__card_id,
+                self.__price.satang,
+                self.__point,
+                self.__date,
+                self.__pet_service_list,
+                [[payment_type, card_id, amount.satang]
+                 for payment_type, card_id, amount in self.__tenders],
+            ], separators=(",", ":"), ensure_ascii=False)
+        return self.__compact
+
+
+class LedgerEntry:
+    Deposit = "deposit"
+    Charge = "charge"
+    PrepaidHotel = "prepaid_hotel"
+    Refund = "refund"
+    Kinds = (Deposit, Charge, PrepaidHotel, Refund)
+
+    def __init__(self, entry_id, kind, time, customer_id, amount, method_type, card_id=None, payment_id=None):
+        self.__entry_id = entry_id
+        self.__kind = kind
+        self.__time = time
+        self.__customer_id = customer_id
+        self.__amount = amount
+        self.__method_type = method_type
+        self.__card_id = card_id
+        self.__payment_id = payment_id
+
+    @property
+    def entry_id(self):
+        return self.__entry_id
+
+    @property
+    def kind(self):
+        return self.__kind
+
+    @property
+    def time(self):
+        return self.__time
+
+    @property
+    def customer_id(self):
+        return self.__customer_id
+
+    @property
+    def amount(self):
+        return self.__amount
+
+    @property
+    def card_id(self):
+        return self.__card_id
+
+    @property
+    def payment_id(self):
+        return self.__payment_id
+
+    @property
+    def card_delta(self):
+        # ผลต่อยอดเงินในบัตร เติมเงิน/คืนเงินเป็นบวก จ่ายเป็นลบ
+        if self.__card_id == None:
+            return Money(0)
+        if self.__kind == self.Deposit or self.__kind == self.Refund:
+            return self.__amount
+        return -self.__amount
+
+    def get_details(self):
+        return {
+            "entry_id": self.__entry_id,
+            "kind": self.__kind,
+            "time": self.__time.strftime("%Y-%m-%d %H:%M:%S"),
+            "customer_id": self.__customer_id,
+            "amount": self.__amount.to_baht(),
+            "method": self.__method_type,
+            "card_id": self.__card_id,
+            "payment_id": self.__payment_id,
+        }
+
+
+class Ledger:
+    # บันทึกการเงินทั้งคลินิกแบบเพิ่มต่อท้ายอย่างเดียว ห้ามแก้/ลบ entry ที่ลงไปแล้ว
+    # เวลา entry ไม่ลดลงเสมอ ค้นช่วงเวลาด้วย bisect ได้
+    # ยอดบัตร: เก็บ snapshot ทุก SnapshotInterval entry ของบัตรนั้น
+    # ยอด ณ เวลาใดๆ = snapshot ก่อนหน้า + เล่น entry ต่อไม่เกิน SnapshotInterval ตัว
+    SnapshotInterval = 32
+    RevenueKinds = (LedgerEntry.Charge, LedgerEntry.PrepaidHotel, LedgerEntry.Refund)
+
+    def __init__(self):
+        self.__entries = []
+        self.__times = []
+        # ยอดสะสม (สตางค์) ของแต่ละประเภทก่อน entry ที่ i ใช้หารายได้ช่วงเวลาใดๆ ด้วยการลบกัน
+        self.__revenue_prefix = {kind: [0] for kind in self.RevenueKinds}
+        self.__card_entries = {}  # card_id -> [entry]
+        self.__card_times = {}  # card_id -> [time]
+        self.__card_snapshots = {}  # card_id -> [ยอดหลัง entry ที่ 0, Interval, 2*Interval, ...]
+        self.__card_balance = {}  # card_id -> ยอดล่าสุด
+        self.__lock = threading.Lock()
+
+    def append(self, kind, customer_id, amount, method_type, card_id=None, payment_id=None, time=None):
+        if kind not in LedgerEntry.Kinds:
+            raise ValueError(f"Unknown ledger entry kind: {kind}")
+        with self.__lock:
+            if time == None:
+                time = datetime.now()
+            if self.__times and time < self.__times[-1]:
+                time = self.__times[-1]
+            entry = LedgerEntry(len(self.__entries) + 1, kind, time, customer_id,
+                                amount, method_type, card_id, payment_id)
+            self.__entries.append(entry)
+            self.__times.append(time)
+            for revenue_kind, prefix in self.__revenue_prefix.items():
+                satang = amount.satang if revenue_kind == kind else 0
+                prefix.append(prefix[-1] + satang)
+
+            if card_id != None:
+                if card_id not in self.__card_entries:
+                    self.__card_entries[card_id] = []
+                    self.__card_times[card_id] = []
+                    self.__card_snapshots[card_id] = [Money(0)]
+                    self.__card_balance[card_id] = Money(0)
+                card_entries = self.__card_entries[card_id]
+                card_entries.append(entry)
+                self.__card_times[card_id].append(time)
+                self.__card_balance[card_id] += entry.card_delta
+                if len(card_entries) % self.SnapshotInterval == 0:
+                    self.__card_snapshots[card_id].append(
+                        self.__card_balance[card_id])
+            return entry
+
+    def get_card_balance(self, card_id, at: datetime = None):
+        with self.__lock:
+            if card_id not in self.__card_entries:
+                return Money(0)
+            if at == None:
+                return self.__card_balance[card_id]
+            count = bisect.bisect_right(self.__card_times[card_id], at)
+            snapshot_index = count // self.SnapshotInterval
+            balance = self.__card_snapshots[card_id][snapshot_index]
+            card_entries = self.__card_entries[card_id]
+            for entry in card_entries[snapshot_index * self.SnapshotInterval:count]:
+                balance += entry.card_delta
+            return balance
+
+    def get_revenue(self, time_start: datetime, time_end: datetime):
+        # รายได้ในช่วง [time_start, time_end) แยกตามประเภท
+        with self.__lock:
+            lo = bisect.bisect_left(self.__times, time_start)
+            hi = bisect.bisect_left(self.__times, time_end)
+            revenue = {}
+            for kind, prefix in self.__revenue_prefix.items():
+                revenue[kind] = Money(prefix[hi] - prefix[lo])
+            return revenue, hi - lo
+
+    def get_entries(self, time_start: datetime = None, time_end: datetime = None):
+        with self.__lock:
+            lo = 0
+            hi = len(self.__entries)
+            if time_start != None:
+                lo = bisect.bisect_left(self.__times, time_start)
+            if time_end != None:
+                hi = bisect.bisect_left(self.__times, time_end)
+            return self.__entries[lo:hi]
+
+    def __len__(self):
+        return len(self.__entries)
+
 
 # Customer Related Class
 # Service CLass
 class RecordService:
     def __init__(self, date):
         self.__date = date
+        # บิลจากการจองเก็บเป็น datetime ส่วนบิล walk-in เก็บเป็น string แปลงครั้งเดียวไว้เรียงตามเวลา
+        if isinstance(date, datetime):
+            self.__bill_time = date
+        else:
+            try:
+                self.__bill_time = datetime.strptime(str(date), "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                # วันที่อ่านไม่ออก ให้อยู่ต้นประวัติ
+                self.__bill_time = datetime.min
         self.__sub_service = []
-        self.__price = 0
+        # ยอดรวมและจำนวน service แต่ละประเภท อัปเดตทุกครั้งที่เพิ่ม/ลบ sub service
+        self.__price = Money(0)
+        self.__medical_count = 0
+        self.__grooming_count = 0
+        self.__hotel_admit_count = 0
         self.__is_paid = False
+        self.__owner = None  # pet เจ้าของบิล ใช้แจ้งให้ล้าง quote ของลูกค้า
 
     @property
     def price(self):
@@ -178,30 +443,58 @@ class RecordService:
     def get_date(self):
         return self.__date
 
+    @property
+    def bill_time(self):
+        return self.__bill_time
+
     @property
     def is_paid(self):
         return self.__is_paid
 
     @property
     def sub_service(self):
-        return self.__sub_service
+        # เพิ่ม/ลบผ่าน append_sub_service / remove_sub_service เท่านั้น ยอดรวมจะได้ไม่เพี้ยน
+        return tuple(self.__sub_service)
 
     @is_paid.setter
     def is_paid(self, paid=True):
         self.__is_paid = paid
+        self.__notify_owner()
+
+    def attach_owner(self, pet):
+        self.__owner = pet
+
+    def __notify_owner(self):
+        if self.__owner != None:
+            self.__owner.notify_service_changed()
+
+    def __update_running_total(self, service, change):
+        if isinstance(service, HotelService):
+            # โรงแรมที่จองล่วงหน้าจ่ายไปแล้วตอนจอง ไม่นับในบิลนี้
+            if service.is_from_reservation:
+                return
+            self.__hotel_admit_count += change
+        elif isinstance(service, MedicalService):
+            self.__medical_count += change
+        elif isinstance(service, GroomingService):
+            self.__grooming_count += change
+        self.__price += change * service.price
 
     def append_sub_service(self, sub_service):
         self.__sub_service.append(sub_service)
+        self.__update_running_total(sub_service, 1)
+        self.__notify_owner()
 
-    def calculate_total_price(self):
-        total = 0
-        for service in self.__sub_service:
-            if isinstance(service, HotelService):
-                if service.is_from_reservation:
-                    continue
+    def remove_sub_service(self, sub_service):
+        try:
+            self.__sub_service.remove(sub_service)
+        except ValueError:
+            return False
+        self.__update_running_total(sub_service, -1)
+        self.__notify_owner()
+        return True
 
-            total += service.price
-        self.__price = total
+    def calculate_total_price(self):
         return self.__price
 
     def get_service_list(self):
@@ -212,22 +505,13 @@ class RecordService:
         return service_list
 
     def check_has_medical_service(self):
-        for service in self.__sub_service:
-            if isinstance(service, MedicalService):
-                return True
-        return False
+        return self.__medical_count > 0
 
     def check_has_grooming_service(self):
-        for service in self.__sub_service:
-            if isinstance(service, GroomingService):
-                return True
-        return False
+        return self.__grooming_count > 0
 
     def check_has_hotel_admit_service(self):
-        for service in self.__sub_service:
-            if isinstance(service, HotelService) and service.is_from_reservation == False:
-                return True
-        return False
+        return self.__hotel_admit_count > 0
 
 # ขอเพิ่ม Service คร่าวๆ ไว้ใช้ตอน Payment
 
@@ -247,18 +531,14 @@ class Service:
 
 
 class GroomingService(Service):
-    BasePrice = 2000
-
-    def __init__(self, pet):
-        price = self.calculate_grooming_service_price(pet)
+    # ราคามาจาก PricingRules.grooming_price ตาม pet.aggressive
+    def __init__(self, pet, price, groomer=None):
         super().__init__("Grooming", price)
+        self.__groomer = groomer
 
-    def calculate_grooming_service_price(self, pet):
-        price = self.BasePrice
-        aggressive = pet.aggressive
-        if aggressive:
-            price += 500
-        return price
+    @property
+    def groomer(self):
+        return self.__groomer
 
 
 class HotelService(Service):
@@ -312,7 +592,7 @@ class MedicalService(Service):
             "Symptom": self.__symptom,
             "Medicine": self.__medicine,
             "Vaccine": self.__vaccine,
-            "Price": self.price,
+            "Price": self.price.to_baht(),
             "Should Admit": self.__should_admit
         }
 
@@ -328,7 +608,15 @@ class Pet:
         self.__species = species
         self.__weight = weight
         self.__customer_id = customer_id
-        self.__service = []
+        # บิลที่ยังไม่จ่ายเรียงตามลำดับที่สร้าง ตัวแรกคือบิลที่เปิดอยู่
+        # บิลที่จ่ายแล้วย้ายไป history จะถูกแตะเฉพาะตอนขอดูประวัติ
+        self.__unpaid_service = deque()
+        self.__service_history = []
+        # ทุกบิลเรียงตามวันที่ [(bill_time, bill_no, bill)] ใช้แบ่งหน้าประวัติด้วย bisect
+        # bill_no เป็นลำดับที่สร้าง ไม่เปลี่ยนแม้มีบิลใหม่แทรกหรือบิลถูกลบ
+        self.__bill_index = []
+        self.__bill_count = 0
+        self.__owner = None  # Customer เจ้าของ ใช้แจ้งให้ล้าง quote
         self.__medical_record = []
         self.__aggressive = bool(aggressive)
 
@@ -338,7 +626,15 @@ class Pet:
 
     @property
     def service(self):
-        return self.__service
+        return self.__service_history + list(self.__unpaid_service)
+
+    @property
+    def unpaid_service(self):
+        return tuple(self.__unpaid_service)
+
+    @property
+    def service_history(self):
+        return self.__service_history
 
     @property
     def aggressive(self):
@@ -348,6 +644,10 @@ class Pet:
     def id(self):
         return self.__petID
 
+    @property
+    def customer_id(self):
+        return self.__customer_id
+
     @property
     def name(self):
         return self.__name
@@ -356,14 +656,66 @@ class Pet:
     def medical_record(self):
         return self.__medical_record
 
+    def attach_owner(self, customer):
+        self.__owner = customer
+
+    def notify_service_changed(self):
+        if self.__owner != None:
+            self.__owner.invalidate_quote()
+
     def search_unpaid_service(self):
-        for service in self.__service:
-            if service.is_paid == False:
-                return service
+        if self.__unpaid_service:
+            return self.__unpaid_service[0]
         return None
 
+    @property
+    def bill_total(self):
+        return len(self.__bill_index)
+
+    def iter_bills(self, time_start: datetime = None, time_end: datetime = None, cursor=None):
+        # ไล่บิลในช่วง [time_start, time_end) ทีละใบ หลัง cursor (bill_time, bill_no) ถ้ามี
+        lo = 0
+        hi = len(self.__bill_index)
+        if time_start != None:
+            lo = bisect.bisect_left(self.__bill_index, (time_start,))
+        if cursor != None:
+            lo = max(lo, bisect.bisect_left(self.__bill_index, (cursor[0], cursor[1] + 1)))
+        if time_end != None:
+            hi = bisect.bisect_left(self.__bill_index, (time_end,))
+        for index in range(lo, hi):
+            yield self.__bill_index[index]
+
     def append_big_service(self, service):
-        self.__service.append(service)
+        service.attach_owner(self)
+        self.__bill_count += 1
+        bisect.insort(self.__bill_index,
+                      (service.bill_time, self.__bill_count, service))
+        if service.is_paid:
+            self.__service_history.append(service)
+        else:
+            self.__unpaid_service.append(service)
+        self.notify_service_changed()
+
+    def mark_service_paid(self):
+        # จ่ายบิลที่เปิดอยู่ แล้วย้ายไปเก็บใน history
+        if not self.__unpaid_service:
+            return None
+        service = self.__unpaid_service.popleft()
+        service.is_paid = True
+        self.__service_history.append(service)
+        return service
+
+    def remove_big_service(self, service):
+        try:
+            self.__unpaid_service.remove(service)
+        except ValueError:
+            return False
+        index = bisect.bisect_left(self.__bill_index, (service.bill_time,))
+        while self.__bill_index[index][2] is not service:
+            index += 1
+        del self.__bill_index[index]
+        self.notify_service_changed()
+        return True
 
     # สร้างเผื่อว่าอนาคตอยากค้นหาประวัติการรักษาเฉพาะอันไหนขึ้นมา
     def search_medical_record(self, record_id):
@@ -390,16 +742,78 @@ class Customer:
         self.__email = email
         self.__pet = []
         self.__reservation = []
+        self.__reservation_history = []
         self.__payment_list = []
         self.__card = []
         self.__notification = Notification()
+        # ล็อกบัตร แต้ม และบิลของลูกค้าคนนี้
+        self.__lock = threading.RLock()
+        # cache ยอดที่ต้องจ่าย key = (use_cp, use_rw_card) -> (version, price)
+        # อะไรที่ทำให้ยอดเปลี่ยน (บิลของ pet, coupon, rewards card, สิทธิ์ส่วนลด) ต้องเพิ่ม version
+        self.__quote_version = 0
+        self.__quote_cache = {}
+        self.__open_bill_index = None
+
+    @property
+    def lock(self):
+        return self.__lock
+
+    @property
+    def quote_version(self):
+        return self.__quote_version
+
+    def attach_open_bill_index(self, open_bill_index):
+        self.__open_bill_index = open_bill_index
+        self.__update_open_bill_index()
+
+    def has_open_bill(self):
+        for pet in self.__pet:
+            if pet.search_unpaid_service() != None:
+                return True
+        return False
+
+    def __update_open_bill_index(self):
+        if self.__open_bill_index == None:
+            return
+        if self.has_open_bill():
+            self.__open_bill_index.mark_open(self.__customer_id)
+        else:
+            self.__open_bill_index.mark_closed(self.__customer_id)
+
+    def invalidate_quote(self):
+        self.__quote_version += 1
+        self.__update_open_bill_index()
+
+    def get_cached_quote(self, key):
+        cached = self.__quote_cache.get(key)
+        if cached == None or cached[0] != self.__quote_version:
+            return None
+        return cached[1]
+
+    def set_cached_quote(self, key, price):
+        self.__quote_cache[key] = (self.__quote_version, price)
 
     def add_pet(self, pet: Pet):
         self.__pet.append(pet)
+        pet.attach_owner(self)
+        self.invalidate_quote()
 
     def add_reservation(self, reservation):
         self.__reservation.append(reservation)
 
+    def archive_expired_reservations(self, now: datetime):
+        active = []
+        archived = 0
+        for reservation in self.__reservation:
+            if reservation.is_expired(now):
+                self.__reservation_history.append(reservation)
+                archived += 1
+            else:
+                active.append(reservation)
+        if archived:
+            self.__reservation = active
+        return archived
+
     def add_payment(self, payment):
         self.__payment_list.append(payment)
         return "Success"
@@ -419,10 +833,6 @@ class Customer:
                 return card
         return None
 
-    def deposit_to_card(self, cardID, money):
-        card = self.search_card(cardID)
-        card.deposit(money)
-
     def validate_card_for_payment(self, card_id):
         for card in self.__card:
             if card == card_id:
@@ -463,16 +873,19 @@ class Customer:
     def reservation(self):
         return self.__reservation
 
+    @property
+    def reservation_history(self):
+        return self.__reservation_history
+
 
 class Member(Customer):
-    DiscountRate = 0
+    # อัตราส่วนลดของแต่ละ tier อยู่ใน PricingRules.tier_rate
 
-    def __init__(self, customer_id, name, phone_number, email, sign_up_date, tier, rate, point=0):
+    def __init__(self, customer_id, name, phone_number, email, sign_up_date, tier, point=0):
         super().__init__(customer_id, name, phone_number, email)
         self.__signup_date = sign_up_date
         self.__point = point
         self.__tier = tier
-        self.__rate = rate
 
     @property
     def point(self):
@@ -482,10 +895,6 @@ class Member(Customer):
     def get_tier(self):
         return self.__tier
 
-    @property
-    def get_rate(self):
-        return self.__rate
-
     def add_point(self, point):
         self.__point += point
 
@@ -494,11 +903,10 @@ class Member(Customer):
 
 
 class SilverMember(Member):
-    # DiscountRate = 0.01
 
     def __init__(self, customer_id, name, phone_number, email, sign_up_date, point=0):
         super().__init__(customer_id, name, phone_number,
-                         email, sign_up_date, "silver", 0.01, point)
+                         email, sign_up_date, "silver", point)
         self.__discount_limit_per_year = 6
         self.__count_for_use_discount = 0
 
@@ -511,55 +919,60 @@ class SilverMember(Member):
     def add_count_for_use_discount(self):
         if not self.check_is_limit():
             self.__count_for_use_discount += 1
+            self.invalidate_quote()
 
 
 class GoldMember(Member):
-    # DiscountRate = 0.05
 
     def __init__(self, customer_id, name, phone_number, email, sign_up_date, point=0):
         super().__init__(customer_id, name, phone_number,
-                         email, sign_up_date, "gold", 0.05, point)
-        self.__coupon = []
+                         email, sign_up_date, "gold", point)
+        self.__coupon = CouponWallet()
 
-    def add_coupon(self, coupon):
-        self.__coupon.append(coupon)
+    @property
+    def coupon_count(self):
+        return len(self.__coupon)
+
+    def add_coupon(self, coupon, count=1):
+        self.__coupon.add(coupon, count)
+        self.invalidate_quote()
 
     def get_coupon(self):
-        if self.__coupon:
-            return self.__coupon[0]
-        else:
-            return None
+        return self.__coupon.peek()
 
     def delete_coupon(self):
-        try:
-            self.__coupon.pop(0)
-        except IndexError:
+        if self.__coupon.take() == None:
             return "No coupon"
+        self.invalidate_quote()
 
 
 class PlatinumMember(Member):
-    # DiscountRate = 0.1
 
     def __init__(self, customer_id, name, phone_number, email, sign_up_date, point=0):
         super().__init__(customer_id, name, phone_number,
-                         email, sign_up_date, "platinum", 0.1, point)
-        self.__coupon = []
+                         email, sign_up_date, "platinum", point)
+        self.__coupon = CouponWallet()
         self.__rewards_card = None
 
-    def add_coupon(self, coupon):
-        self.__coupon.append(coupon)
+    @property
+    def coupon_count(self):
+        return len(self.__coupon)
+
+    def add_coupon(self, coupon, count=1):
+        self.__coupon.add(coupon, count)
+        self.invalidate_quote()
 
     def get_coupon(self):
-        if self.__coupon:
-            return self.__coupon[0]
-        else:
-            return None
+        return self.__coupon.peek()
 
     def delete_coupon(self):
-        self.__coupon.pop(0)
+        if self.__coupon.take() == None:
+            raise IndexError("No coupon")
+        self.invalidate_quote()
 
     def add_rewards_card(self, rewards_card):
         self.__rewards_card = rewards_card
+        self.invalidate_quote()
 
     @property
     def get_rewards_card(self):
@@ -578,6 +991,7 @@ class PlatinumMember(Member):
 
     def delete_reward_card(self):
         self.__rewards_card = None
+        self.invalidate_quote()
 
     def add_count_to_rewards_card(self):
         if self.__rewards_card == None:
@@ -585,6 +999,7 @@ class PlatinumMember(Member):
             self.add_rewards_card(rewards_card)
         else:
             self.__rewards_card.add_count()
+            self.invalidate_quote()
 
 
 class RewardsCard:
@@ -607,57 +1022,338 @@ class RewardsCard:
 
 
 class Coupon:
+    # มูลค่าคูปองอยู่ใน PricingRules.coupon_discount ใช้ค่าล่าสุดตอนคิดราคา
     def __init__(self, id):
         self.__coupon_id = id
-        self.__discount = 10
 
     @property
-    def use_coupon(self):
-        return self.__discount
+    def id(self):
+        return self.__coupon_id
+
+
+class CouponWallet:
+    # คูปองเก็บเป็นชุด [coupon, จำนวน] ตามลำดับที่แลก แลกทีละหลายใบได้ในชุดเดียว
+    # ใช้ใบเก่าสุดก่อน เพิ่ม/ใช้/นับจำนวนเป็น O(1)
+    def __init__(self):
+        self.__batches = deque()
+        self.__count = 0
+
+    def add(self, coupon, count=1):
+        if count <= 0:
+            return
+        self.__batches.append([coupon, count])
+        self.__count += count
+
+    def peek(self):
+        if self.__batches:
+            return self.__batches[0][0]
+        return None
+
+    def take(self):
+        if not self.__batches:
+            return None
+        batch = self.__batches[0]
+        batch[1] -= 1
+        if batch[1] == 0:
+            self.__batches.popleft()
+        self.__count -= 1
+        return batch[0]
+
+    def __len__(self):
+        return self.__count
+
+
+class OpenBillIndex:
+    # customer_id ของลูกค้าที่ยังมีบิลค้างจ่าย เรียงตาม id ใช้เป็น cursor ตอนแบ่งหน้า
+    # Customer อัปเดตเองทุกครั้งที่บิลของ pet เปลี่ยน
+    def __init__(self):
+        self.__customer_ids = []
+        self.__lock = threading.RLock()
+
+    def add_customer(self, customer):
+        customer.attach_open_bill_index(self)
+
+    def mark_open(self, customer_id):
+        with self.__lock:
+            index = bisect.bisect_left(self.__customer_ids, customer_id)
+            if index == len(self.__customer_ids) or self.__customer_ids[index] != customer_id:
+                self.__customer_ids.insert(index, customer_id)
+
+    def mark_closed(self, customer_id):
+        with self.__lock:
+            index = bisect.bisect_left(self.__customer_ids, customer_id)
+            if index < len(self.__customer_ids) and self.__customer_ids[index] == customer_id:
+                del self.__customer_ids[index]
+
+    def get_page(self, cursor=None, limit=50):
+        # คืน customer_id ที่มากกว่า cursor ไม่เกิน limit คน และ cursor ของหน้าถัดไป (None ถ้าหมดแล้ว)
+        with self.__lock:
+            start = 0
+            if cursor != None:
+                start = bisect.bisect_right(self.__customer_ids, cursor)
+            page = self.__customer_ids[start:start + limit]
+            if start + limit < len(self.__customer_ids):
+                return page, page[-1]
+            return page, None
+
+    def __len__(self):
+        return len(self.__customer_ids)
+
 
 # Employee Related Class
 
 
 class TimeSchedule:
-    def __init__(self, capacity=1):
-        self.__busy_slots = []  # เก็บเป็น Tuple: [(start_dt, end_dt)]
+    def __init__(self, capacity=1, slot_minutes=None):
+        # เก็บเป็น Tuple: [(start_dt, end_dt)] เรียงตาม start_dt เสมอ ใช้ bisect ค้นหา
+        self.__busy_slots = []
+        self.__archived_slots = []  # slot ที่จบไปแล้ว ย้ายออกจาก busy_slots
         self.__capacity = capacity
+        # ช่วงเวลาที่ยาวที่สุดที่เคยจอง ใช้จำกัดขอบเขตการค้นหาช่วงที่ทับซ้อน
+        self.__longest_slot = timedelta(0)
+        # calendar mode (เปิดเมื่อส่ง slot_minutes มาเท่านั้น): แบ่งวันเป็นช่อง slot_minutes นาที
+        # capacity 1 เก็บเป็น bitmask ต่อวัน, capacity > 1 เก็บจำนวนการจองต่อช่อง
+        # ช่วงเวลาที่ไม่ตรงช่องจะถูกปัดออกให้ครอบทั้งช่อง ช่องว่าง = "ว่างแน่นอน"
+        # ช่องเต็มเชื่อได้เฉพาะตอนที่ทุกการจองและช่วงที่ถามตรงช่องพอดี ไม่งั้นเช็คกับ busy_slots อีกรอบ
+        # bit ของช่องต้องเป็น 1 ตราบที่ยังมีการจองแตะช่องนั้นอยู่ (ดู __unmark_booking)
+        self.__slot_minutes = slot_minutes
+        self.__calendar = {}  # date -> int bitmask หรือ list ของจำนวนการจอง
+        self.__unaligned_count = 0  # จำนวนการจองใน busy_slots ที่ไม่ตรงช่อง
+        if slot_minutes:
+            self.__slots_per_day = (24 * 60) // slot_minutes
 
     @property
     def busy_slot(self):
         return self.__busy_slots
 
-    def check_availability(self, time_start: datetime, time_end: datetime) -> bool:
-        overlap_count = 0
-        for busy_start, busy_end in self.__busy_slots:
-            # เช็คว่าเวลาทับซ้อนกันไหม
-            if time_start < busy_end and time_end > busy_start:
-                overlap_count += 1
+    @property
+    def archived_slot(self):
+        return self.__archived_slots
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def slot_minutes(self):
+        return self.__slot_minutes
+
+    def __is_aligned(self, time: datetime):
+        return (time.second == 0 and time.microsecond == 0
+                and (time.hour * 60 + time.minute) % self.__slot_minutes == 0)
+
+    def __get_calendar_ranges(self, time_start: datetime, time_end: datetime):
+        # แปลงช่วงเวลาเป็น [(วัน, ช่องแรก, ช่องสุดท้าย + 1)]
+        day = time_start.date()
+        if time_end.date() == day:
+            # ช่วงที่อยู่ในวันเดียว (เกือบทุกการจอง) คิดจากชั่วโมง/นาทีตรงๆ
+            slot_minutes = self.__slot_minutes
+            lo = (time_start.hour * 60 + time_start.minute) // slot_minutes
+            end_minute = time_end.hour * 60 + time_end.minute
+            if time_end.second or time_end.microsecond:
+                hi = end_minute // slot_minutes + 1
+            else:
+                hi = -(-end_minute // slot_minutes)
+            if hi > lo:
+                return [(day, lo, hi)]
+            return []
+        slot_seconds = self.__slot_minutes * 60
+        ranges = []
+        while True:
+            day_start = datetime.combine(day, datetime.min.time())
+            day_end = day_start + timedelta(days=1)
+            lo = int((max(time_start, day_start) - day_start).total_seconds()) // slot_seconds
+            if time_end >= day_end:
+                hi = self.__slots_per_day
+            else:
+                hi = -(-int((time_end - day_start).total_seconds()) // slot_seconds)
+            if hi > lo:
+                ranges.append((day, lo, hi))
+            if time_end <= day_end:
+                break
+            day += timedelta(days=1)
+        return ranges
+
+    def __check_calendar(self, time_start: datetime, time_end: datetime):
+        for day, lo, hi in self.__get_calendar_ranges(time_start, time_end):
+            if self.__capacity == 1:
+                mask = self.__calendar.get(day, 0)
+                if (mask >> lo) & ((1 << (hi - lo)) - 1):
+                    return False
+            else:
+                counts = self.__calendar.get(day)
+                if counts != None and max(counts[lo:hi]) >= self.__capacity:
+                    return False
+        return True
+
+    def __mark_calendar(self, time_start: datetime, time_end: datetime, change):
+        for day, lo, hi in self.__get_calendar_ranges(time_start, time_end):
+            if self.__capacity == 1:
+                bits = ((1 << (hi - lo)) - 1) << lo
+                if change > 0:
+                    self.__calendar[day] = self.__calendar.get(day, 0) | bits
+                else:
+                    mask = self.__calendar.get(day, 0) & ~bits
+                    if mask:
+                        self.__calendar[day] = mask
+                    else:
+                        self.__calendar.pop(day, None)
+            else:
+                counts = self.__calendar.get(day)
+                if counts == None:
+                    counts = [0] * self.__slots_per_day
+                    self.__calendar[day] = counts
+                counts[lo:hi] = [count + change for count in counts[lo:hi]]
+                if change < 0 and not any(counts):
+                    del self.__calendar[day]
+
+    def __mark_booking(self, time_start: datetime, time_end: datetime):
+        self.__mark_calendar(time_start, time_end, 1)
+        if not (self.__is_aligned(time_start) and self.__is_aligned(time_end)):
+            self.__unaligned_count += 1
+
+    def __unmark_booking(self, time_start: datetime, time_end: datetime):
+        # เรียกหลังเอาการจองออกจาก busy_slots แล้ว
+        self.__mark_calendar(time_start, time_end, -1)
+        if not (self.__is_aligned(time_start) and self.__is_aligned(time_end)):
+            self.__unaligned_count -= 1
+            if self.__capacity == 1:
+                self.__restore_shared_slots(time_start, time_end)
+
+    def prune_before(self, now: datetime):
+        # ย้าย slot ที่จบก่อน now ไปเก็บใน archive คืนจำนวนที่ย้าย
+        hi = bisect.bisect_left(self.__busy_slots, (now,))
+        still_busy = []
+        pruned = 0
+        for busy_start, busy_end in self.__busy_slots[:hi]:
+            if busy_end <= now:
+                self.__archived_slots.append((busy_start, busy_end))
+                pruned += 1
+            else:
+                still_busy.append((busy_start, busy_end))
+        if pruned:
+            self.__busy_slots[:hi] = still_busy
+            if self.__slot_minutes:
+                for busy_start, busy_end in self.__archived_slots[-pruned:]:
+                    self.__unmark_booking(busy_start, busy_end)
+        return pruned
+
+    def get_overlapping_slots(self, time_start: datetime, time_end: datetime):
+        # slot ที่ทับซ้อนต้องเริ่มก่อน time_end และเริ่มไม่เก่ากว่า time_start - slot ที่ยาวที่สุด
+        lo = bisect.bisect_left(
+            self.__busy_slots, (time_start - self.__longest_slot,))
+        hi = bisect.bisect_left(self.__busy_slots, (time_end,), lo)
+        overlapping = []
+        for busy_start, busy_end in self.__busy_slots[lo:hi]:
+            if busy_end > time_start:
+                overlapping.append((busy_start, busy_end))
+        return overlapping
+
+    def get_peak_occupancy(self, time_start: datetime, time_end: datetime) -> int:
+        # sweep line: จำนวน slot ที่ใช้งานพร้อมกันมากที่สุดในช่วงเวลาที่ขอ
+        events = []
+        for busy_start, busy_end in self.get_overlapping_slots(time_start, time_end):
+            events.append((max(busy_start, time_start), 1))
+            events.append((min(busy_end, time_end), -1))
+        # ที่เวลาเดียวกันให้ -1 มาก่อน +1 เพราะ slot ที่จบพอดีไม่นับว่าทับกัน
+        events.sort()
+        occupancy = 0
+        peak = 0
+        for _, change in events:
+            occupancy += change
+            if occupancy > peak:
+                peak = occupancy
+        return peak
 
-        if overlap_count < self.__capacity:
+    def check_availability(self, time_start: datetime, time_end: datetime) -> bool:
+        if self.__slot_minutes:
+            if self.__check_calendar(time_start, time_end):
+                return True
+            # ทุกอย่างตรงช่อง ช่องที่เต็มคือเต็มจริง
+            if (self.__unaligned_count == 0 and self.__is_aligned(time_start)
+                    and self.__is_aligned(time_end)):
+                return False
+        if self.get_peak_occupancy(time_start, time_end) < self.__capacity:
             return True
         return False
 
     def add_schedule(self, time_start: datetime, time_end: datetime) -> bool:
         if self.check_availability(time_start, time_end):
-            self.__busy_slots.append((time_start, time_end))
+            bisect.insort(self.__busy_slots, (time_start, time_end))
+            if time_end - time_start > self.__longest_slot:
+                self.__longest_slot = time_end - time_start
+            if self.__slot_minutes:
+                self.__mark_booking(time_start, time_end)
             return True
         return False
 
+    def __iter_slot_ends(self, time_after: datetime):
+        # คืนเวลาสิ้นสุดของ slot ที่จบหลัง time_after เรียงจากน้อยไปมาก (gap ระหว่าง slot)
+        index = bisect.bisect_left(
+            self.__busy_slots, (time_after - self.__longest_slot,))
+        pending_ends = []
+        for busy_start, busy_end in self.__busy_slots[index:]:
+            # slot ที่เหลือเริ่มหลัง busy_start จึงจบหลัง busy_start ทั้งหมด
+            while pending_ends and pending_ends[0] <= busy_start:
+                yield heapq.heappop(pending_ends)
+            if busy_end > time_after:
+                heapq.heappush(pending_ends, busy_end)
+        while pending_ends:
+            yield heapq.heappop(pending_ends)
+
+    def find_free_slots(self, time_after: datetime, duration: timedelta, count=1):
+        free_slots = []
+        candidate = time_after
+        slot_ends = self.__iter_slot_ends(time_after)
+        while len(free_slots) < count:
+            if self.check_availability(candidate, candidate + duration):
+                free_slots.append((candidate, candidate + duration))
+                candidate = candidate + duration
+                continue
+            # ช่วงที่ว่างได้ต้องเริ่มที่เวลาที่มี slot จบเท่านั้น
+            next_candidate = None
+            for slot_end in slot_ends:
+                if slot_end > candidate:
+                    next_candidate = slot_end
+                    break
+            if next_candidate == None:
+                break
+            candidate = next_candidate
+        return free_slots
+
     def remove_schedule(self, time_start: datetime, time_end: datetime):
-        try:
-            self.__busy_slots.remove((time_start, time_end))
-        except ValueError:
-            pass
+        index = bisect.bisect_left(self.__busy_slots, (time_start, time_end))
+        if index < len(self.__busy_slots) and self.__busy_slots[index] == (time_start, time_end):
+            del self.__busy_slots[index]
+            if self.__slot_minutes:
+                self.__unmark_booking(time_start, time_end)
+            return True
+        return False
+
+    def __restore_shared_slots(self, time_start: datetime, time_end: datetime):
+        # ช่องหัว/ท้ายที่ถูกปัดออกอาจมีการจองอื่นแตะอยู่ด้วย ล้าง bit ไปแล้วต้องใส่คืน
+        # ไม่งั้นช่องนั้นจะดูเหมือน "ว่างแน่นอน" แล้วจองทับได้
+        slot = timedelta(minutes=self.__slot_minutes)
+        day_start = datetime.combine(time_start.date(), datetime.min.time())
+        window_start = day_start + ((time_start - day_start) // slot) * slot
+        day_start = datetime.combine(time_end.date(), datetime.min.time())
+        window_end = day_start + -(-(time_end - day_start) // slot) * slot
+        for busy_start, busy_end in self.get_overlapping_slots(window_start, window_end):
+            self.__mark_calendar(busy_start, busy_end, 1)
 
 
 class Employee:
     Type = None
+    # นัดหมอ/อาบน้ำส่วนใหญ่ลงช่อง 15 นาที ใช้ calendar mode ของตารางงาน
+    # ตั้งเป็น None ใน subclass ถ้าต้องการเทียบ tuple อย่างเดียว
+    SlotMinutes = 15
 
     def __init__(self, emp_id, name):
         self.__employee_id = emp_id
         self.__name = name
-        self.__workschedule = TimeSchedule(capacity=1)
+        self.__workschedule = TimeSchedule(
+            capacity=1, slot_minutes=self.SlotMinutes)
+        self.__lock = threading.RLock()
 
     @property
     def name(self):
@@ -668,13 +1364,24 @@ class Employee:
         return self.__employee_id
 
     def get_avaliable_work(self, time_start: datetime, time_end: datetime):
-        return self.__workschedule.check_availability(time_start, time_end)
+        with self.__lock:
+            return self.__workschedule.check_availability(time_start, time_end)
 
     def update_timeslot(self, time_start: datetime, time_end: datetime):
-        return self.__workschedule.add_schedule(time_start, time_end)
+        with self.__lock:
+            return self.__workschedule.add_schedule(time_start, time_end)
 
     def free_timeslot(self, time_start: datetime, time_end: datetime):
-        self.__workschedule.remove_schedule(time_start, time_end)
+        with self.__lock:
+            return self.__workschedule.remove_schedule(time_start, time_end)
+
+    def find_free_timeslot(self, time_after: datetime, duration: timedelta, count=1):
+        with self.__lock:
+            return self.__workschedule.find_free_slots(time_after, duration, count)
+
+    def prune_timeslot(self, now: datetime):
+        with self.__lock:
+            return self.__workschedule.prune_before(now)
 
 
 # class Worker(Employee):
@@ -712,7 +1419,7 @@ class Doctor(Employee):
         symptom = data.symptom
         medicine = data.medicine
         vaccine = data.vaccine
-        price = data.price
+        price = Money.from_baht(data.price)
         should_admit = data.should_admit
 
         medical_service = MedicalService(
@@ -733,17 +1440,125 @@ class Doctor(Employee):
         return medical_service
 
 
+class StaffAllocator:
+    # เลือกพนักงานที่ถูกจองน้อยที่สุดของวันนั้น ด้วย min-heap ตามจำนวนนาทีที่ถูกจอง
+    def __init__(self):
+        self.__staff = {}  # emp_id -> employee
+        self.__booked_minutes = {}  # (day, emp_id) -> minutes
+        self.__version = {}  # (day, emp_id) -> version ของ entry ล่าสุดใน heap
+        self.__day_heap = {}  # day -> [(minutes, emp_id, version)]
+        self.__lock = threading.RLock()
+
+    def add_staff(self, employee):
+        with self.__lock:
+            self.__staff[employee.emp_id] = employee
+            for heap in self.__day_heap.values():
+                heapq.heappush(heap, (0, employee.emp_id, 0))
+
+    def get_staff(self, emp_id):
+        return self.__staff.get(emp_id)
+
+    def get_all_staff(self):
+        with self.__lock:
+            return list(self.__staff.values())
+
+    def get_booked_minutes(self, employee, day):
+        with self.__lock:
+            return self.__booked_minutes.get((day, employee.emp_id), 0)
+
+    def __get_heap(self, day):
+        heap = self.__day_heap.get(day)
+        if heap is None:
+            heap = [(0, emp_id, 0) for emp_id in self.__staff]
+            heapq.heapify(heap)
+            self.__day_heap[day] = heap
+        return heap
+
+    def __change_minutes(self, employee, time_start: datetime, time_end: datetime, sign):
+        day = time_start.date()
+        key = (day, employee.emp_id)
+        minutes = int((time_end - time_start).total_seconds() // 60)
+        self.__booked_minutes[key] = self.__booked_minutes.get(key, 0) + sign * minutes
+        self.__version[key] = self.__version.get(key, 0) + 1
+        heapq.heappush(self.__get_heap(day),
+                       (self.__booked_minutes[key], employee.emp_id, self.__version[key]))
+
+    def allocate(self, time_start: datetime, time_end: datetime, preferred_id=None):
+        # ลองคนที่ลูกค้าเลือกก่อน ถ้าไม่ว่างค่อยเลือกคนที่งานน้อยที่สุด
+        with self.__lock:
+            if preferred_id:
+                employee = self.__staff.get(preferred_id)
+                if employee != None and employee.update_timeslot(time_start, time_end):
+                    self.__change_minutes(employee, time_start, time_end, 1)
+                    return employee
+
+            day = time_start.date()
+            heap = self.__get_heap(day)
+            checked = []
+            allocated = None
+            while heap:
+                entry = heapq.heappop(heap)
+                minutes, emp_id, version = entry
+                if self.__version.get((day, emp_id), 0) != version:
+                    continue  # entry เก่า ทิ้งได้เลย
+                checked.append(entry)
+                employee = self.__staff[emp_id]
+                if employee.update_timeslot(time_start, time_end):
+                    allocated = employee
+                    break
+
+            for entry in checked:
+                heapq.heappush(heap, entry)
+            if allocated != None:
+                self.__change_minutes(allocated, time_start, time_end, 1)
+            return allocated
+
+    def prune_before(self, day):
+        # ลบข้อมูลภาระงานของวันที่ผ่านไปแล้ว
+        with self.__lock:
+            for old_day in [d for d in self.__day_heap if d < day]:
+                del self.__day_heap[old_day]
+            for key in [k for k in self.__booked_minutes if k[0] < day]:
+                del self.__booked_minutes[key]
+                self.__version.pop(key, None)
+
+    def release(self, employee, time_start: datetime, time_end: datetime):
+        with self.__lock:
+            if employee.free_timeslot(time_start, time_end):
+                self.__change_minutes(employee, time_start, time_end, -1)
+                return True
+            return False
+
+
+class Groomer(Employee):
+    Type = "Groomer"
+
+    def __init__(self, emp_id, name):
+        super().__init__(emp_id, name)
+        self.__grooming_service = []
+
+    def add_grooming_service(self, grooming_service):
+        self.__grooming_service.append(grooming_service)
+
+
 # Room
 
 
 class Room(ABC):
-    price_per_day = 0
+    # ตั้งเป็นจำนวนนาทีใน subclass เพื่อเปิด calendar mode ของตารางห้อง
+    SlotMinutes = None
 
     def __init__(self, room_id, room_type, capacity=1):
         self.__room_id = room_id
         self.__room_type = room_type
         self.__capacity = capacity
-        self.__schedule = TimeSchedule(capacity=self.__capacity)
+        self.__schedule = TimeSchedule(
+            capacity=self.__capacity, slot_minutes=self.SlotMinutes)
+        self.__occupancy_index = None
+        self.__lock = threading.RLock()
+
+    def attach_occupancy_index(self, occupancy_index):
+        self.__occupancy_index = occupancy_index
 
     def get_details(self):
         return f"ID: {self.__room_id}, Type: {self.__room_type}"
@@ -752,10 +1567,6 @@ class Room(ABC):
     def room_id(self):
         return self.__room_id
 
-    @property
-    def get_price(self):
-        return self.price_per_day
-
     @property
     def busy_slot(self):
         return self.__schedule.busy_slot
@@ -764,49 +1575,401 @@ class Room(ABC):
     def room_type(self):
         return self.__room_type
 
+    @property
+    def capacity(self):
+        return self.__capacity
+
     def check_availability(self, time_start: datetime, time_end: datetime):
-        return self.__schedule.check_availability(time_start, time_end)
+        with self.__lock:
+            return self.__schedule.check_availability(time_start, time_end)
 
     def book_room(self, time_start: datetime, time_end: datetime):
-        return self.__schedule.add_schedule(time_start, time_end)
+        with self.__lock:
+            if not self.__schedule.add_schedule(time_start, time_end):
+                return False
+            if self.__occupancy_index is not None:
+                self.__occupancy_index.add_booking(self, time_start, time_end)
+            return True
+
+    def find_free_slots(self, time_after: datetime, duration: timedelta, count=1):
+        with self.__lock:
+            return self.__schedule.find_free_slots(time_after, duration, count)
+
+    def get_remaining_capacity(self, time_start: datetime, time_end: datetime):
+        with self.__lock:
+            return self.__capacity - self.__schedule.get_peak_occupancy(time_start, time_end)
+
+    def prune_schedule(self, now: datetime):
+        with self.__lock:
+            return self.__schedule.prune_before(now)
 
     def cancel_room(self, time_start: datetime, time_end: datetime):
-        self.__schedule.remove_schedule(time_start, time_end)
+        with self.__lock:
+            if not self.__schedule.remove_schedule(time_start, time_end):
+                return False
+            if self.__occupancy_index is not None:
+                self.__occupancy_index.remove_booking(self, time_start, time_end)
+            return True
 
 
 class PrivateRoom(Room):
-    price_per_day = 1500
-
     def __init__(self, room_id):
         super().__init__(room_id, "privateroom", capacity=1)
 
 
 class ShareRoom(Room):
-    price_per_day = 500
-
     def __init__(self, room_id):
         super().__init__(room_id, "shareroom", capacity=10)
 
 
+class RoomOccupancyIndex:
+    # นับจำนวนการจองต่อวันของแต่ละห้อง อัปเดตทุกครั้งที่ book_room / cancel_room
+    def __init__(self):
+        self.__rooms = []
+        self.__room_day = {}  # room_id -> {date: count}
+        # ยอดรวมต่อประเภทห้อง ใช้คิดราคาโรงแรมตาม occupancy ของแต่ละคืน นับตาม get_nights
+        self.__type_day = {}  # room_type -> {คืนวันที่: count}
+        self.__type_capacity = {}  # room_type -> ความจุรวมทุกห้อง
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def get_days(time_start: datetime, time_end: datetime):
+        last_day = time_end.date()
+        # ถ้าออกตอนเที่ยงคืนพอดี ไม่นับวันสุดท้าย
+        if time_end.time() == datetime.min.time() and last_day > time_start.date():
+            last_day -= timedelta(days=1)
+        days = []
+        day = time_start.date()
+        while day <= last_day:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    @staticmethod
+    def get_nights(time_start: datetime, time_end: datetime):
+        # คืนที่พัก = [วันเข้า, วันออก) อย่างน้อย 1 คืน วันที่ออกไม่นับ ห้องว่างให้คนเข้าใหม่ได้
+        nights = [time_start.date()]
+        night = time_start.date() + timedelta(days=1)
+        while night < time_end.date():
+            nights.append(night)
+            night += timedelta(days=1)
+        return nights
+
+    def add_room(self, room):
+        with self.__lock:
+            self.__rooms.append(room)
+            self.__room_day[room.room_id] = {}
+            self.__type_day.setdefault(room.room_type, {})
+            self.__type_capacity[room.room_type] = self.__type_capacity.get(
+                room.room_type, 0) + room.capacity
+            room.attach_occupancy_index(self)
+
+    def add_booking(self, room, time_start: datetime, time_end: datetime):
+        with self.__lock:
+            day_count = self.__room_day[room.room_id]
+            type_count = self.__type_day[room.room_type]
+            for day in self.get_days(time_start, time_end):
+                day_count[day] = day_count.get(day, 0) + 1
+            for night in self.get_nights(time_start, time_end):
+                type_count[night] = type_count.get(night, 0) + 1
+
+    def remove_booking(self, room, time_start: datetime, time_end: datetime):
+        with self.__lock:
+            day_count = self.__room_day[room.room_id]
+            type_count = self.__type_day[room.room_type]
+            for day in self.get_days(time_start, time_end):
+                day_count[day] -= 1
+                if day_count[day] == 0:
+                    del day_count[day]
+            for night in self.get_nights(time_start, time_end):
+                type_count[night] -= 1
+                if type_count[night] == 0:
+                    del type_count[night]
+
+    def prune_before(self, day):
+        with self.__lock:
+            for day_count in self.__room_day.values():
+                for old_day in [d for d in day_count if d < day]:
+                    del day_count[old_day]
+            for type_count in self.__type_day.values():
+                for old_day in [d for d in type_count if d < day]:
+                    del type_count[old_day]
+
+    def get_remaining_capacity(self, room, days):
+        with self.__lock:
+            day_count = self.__room_day[room.room_id]
+            peak = 0
+            for day in days:
+                count = day_count.get(day, 0)
+                if count > peak:
+                    peak = count
+            return room.capacity - peak
+
+    def get_type_occupancy(self, room_type, nights):
+        # คืน ([จำนวนที่จองของแต่ละคืน], ความจุรวม) ของห้องประเภทนี้
+        with self.__lock:
+            type_count = self.__type_day.get(room_type, {})
+            return [type_count.get(night, 0) for night in nights], self.__type_capacity.get(room_type, 0)
+
+    def search_available_rooms(self, time_start: datetime, time_end: datetime, room_type=None):
+        # นับแบบ "วันที่แตะ" จึงเป็นค่าที่ไม่ต่ำกว่าความจริง ห้องที่เหลือที่ว่าง = ว่างแน่นอน
+        # ห้องที่ดูเต็ม (เช่นมีคน check-out เช้าวันที่จะเข้า) คืนแยกไว้ให้เช็คกับตารางจริงอีกที
+        # คืน ([(room, remaining)], [room ที่ต้องเช็คเพิ่ม])
+        days = self.get_days(time_start, time_end)
+        with self.__lock:
+            available = []
+            to_confirm = []
+            for room in self.__rooms:
+                if room_type and room.room_type != room_type:
+                    continue
+                remaining = self.get_remaining_capacity(room, days)
+                if remaining > 0:
+                    available.append((room, remaining))
+                else:
+                    to_confirm.append(room)
+            return available, to_confirm
+
+
+class WaitlistEntry:
+    def __init__(self, waitlist_id, customer, pet, service_type, time_start, time_end,
+                 room_type=None, payment_method=None, card_id=None, doctor_id=None, priority=0):
+        self.waitlist_id = waitlist_id
+        self.customer = customer
+        self.pet = pet
+        self.service_type = service_type
+        self.time_start = time_start
+        self.time_end = time_end
+        self.room_type = room_type
+        self.payment_method = payment_method
+        self.card_id = card_id
+        self.doctor_id = doctor_id
+        self.priority = priority
+        self.requested_at = datetime.now()
+
+    def get_details(self):
+        return {
+            "waitlist_id": self.waitlist_id,
+            "pet_name": self.pet.name,
+            "service_type": self.service_type,
+            "time_start": self.time_start.strftime("%Y-%m-%d %H:%M"),
+            "time_end": self.time_end.strftime("%Y-%m-%d %H:%M"),
+            "room_type": self.room_type,
+            "requested_at": self.requested_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+class Waitlist:
+    # คิวรอของแต่ละประเภท resource แยกตามวันที่ต้องการ
+    # แต่ละวันเป็น heap เรียงตาม (ลำดับ tier, เวลาที่ขอ)
+    def __init__(self):
+        self.__entries = {}  # waitlist_id -> entry
+        self.__index = {}  # resource_key -> {date: [(priority, requested_at, seq, waitlist_id)]}
+        self.__pet_entries = {}  # (pet_id, service_type) -> {waitlist_id}
+        self.__dead = 0  # key ใน heap ที่ entry ถูกลบไปแล้ว ล้างทิ้งเมื่อมีมากเกิน
+        self.__seq = 0
+        self.__lock = threading.RLock()
+
+    def add(self, resource_key, entry: WaitlistEntry):
+        with self.__lock:
+            self.__entries[entry.waitlist_id] = entry
+            self.__pet_entries.setdefault(
+                (entry.pet.id, entry.service_type), set()).add(entry.waitlist_id)
+            self.__seq += 1
+            day_index = self.__index.setdefault(resource_key, {})
+            for day in RoomOccupancyIndex.get_days(entry.time_start, entry.time_end):
+                heapq.heappush(day_index.setdefault(day, []),
+                               (entry.priority, entry.requested_at, self.__seq, entry.waitlist_id))
+
+    def remove(self, waitlist_id):
+        # entry ใน heap ลบแบบ lazy ตอนค้นหา
+        with self.__lock:
+            entry = self.__entries.pop(waitlist_id, None)
+            if entry != None:
+                self.__forget(entry)
+            return entry
+
+    def remove_pet_entries(self, pet, service_type):
+        # pet จองบริการนี้ได้แล้ว ไม่ต้องรอคิวของบริการเดียวกันอีก กันจองซ้ำตอนเลื่อนคิว
+        with self.__lock:
+            removed = []
+            for waitlist_id in list(self.__pet_entries.get((pet.id, service_type.lower()), ())):
+                removed.append(self.remove(waitlist_id))
+            return removed
+
+    def __forget(self, entry):
+        pet_key = (entry.pet.id, entry.service_type)
+        waitlist_ids = self.__pet_entries.get(pet_key)
+        if waitlist_ids != None:
+            waitlist_ids.discard(entry.waitlist_id)
+            if not waitlist_ids:
+                del self.__pet_entries[pet_key]
+        self.__dead += 1
+        if self.__dead > len(self.__entries) + 64:
+            self.__compact()
+
+    def __compact(self):
+        for day_index in self.__index.values():
+            for day in list(day_index):
+                alive = [key for key in day_index[day] if key[3] in self.__entries]
+                if alive:
+                    heapq.heapify(alive)
+                    day_index[day] = alive
+                else:
+                    del day_index[day]
+        self.__dead = 0
+
+    def get(self, waitlist_id):
+        with self.__lock:
+            return self.__entries.get(waitlist_id)
+
+    def get_customer_entries(self, customer):
+        with self.__lock:
+            entries = []
+            for entry in self.__entries.values():
+                if entry.customer == customer:
+                    entries.append(entry)
+            return entries
+
+    def get_candidates(self, resource_key, time_start: datetime, time_end: datetime, limit=None, skip=()):
+        # คนที่รอช่วงเวลาที่ทับกับช่วงที่ว่างขึ้นมา เรียงตามลำดับความสำคัญ ไม่เกิน limit คน
+        # ไล่ heap ของทุกวันพร้อมกันตามลำดับ heap (ดึงตัวเล็กสุด แล้วค่อยดูลูกของมัน)
+        # ไม่แก้ heap จริง และหยุดทันทีเมื่อได้ครบ limit
+        with self.__lock:
+            day_index = self.__index.get(resource_key)
+            if not day_index:
+                return []
+            heaps = []
+            for day in RoomOccupancyIndex.get_days(time_start, time_end):
+                if day_index.get(day):
+                    heaps.append(day_index[day])
+            frontier = [(heap[0], heap_no, 0) for heap_no, heap in enumerate(heaps)]
+            heapq.heapify(frontier)
+            candidates = []
+            seen = set()
+            while frontier and (limit == None or len(candidates) < limit):
+                key, heap_no, position = heapq.heappop(frontier)
+                heap = heaps[heap_no]
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], heap_no, child))
+                waitlist_id = key[3]
+                if waitlist_id in seen or waitlist_id in skip:
+                    continue
+                seen.add(waitlist_id)
+                entry = self.__entries.get(waitlist_id)
+                if entry != None and entry.time_start < time_end and entry.time_end > time_start:
+                    candidates.append(entry)
+            return candidates
+
+    def prune_before(self, now: datetime):
+        # คนที่รอช่วงเวลาที่เริ่มไปแล้วไม่ต้องรอต่อ
+        with self.__lock:
+            expired = []
+            for waitlist_id, entry in self.__entries.items():
+                if entry.time_start <= now:
+                    expired.append(waitlist_id)
+            for waitlist_id in expired:
+                self.__forget(self.__entries.pop(waitlist_id))
+            for day_index in self.__index.values():
+                for old_day in [d for d in day_index if d < now.date()]:
+                    del day_index[old_day]
+            return len(expired)
+
+
+class IdempotencyCache:
+    # จำผลของคำขอที่มี idempotency key ไว้ชั่วคราว ถ้า client ส่งซ้ำ (retry) จะได้ผลเดิม
+    # โดยไม่ตัดเงินหรือจองซ้ำ เก็บตามลำดับเวลาที่ใส่ ตัวเก่าสุดอยู่หน้าสุดเสมอ
+    # ผู้เรียกใส่เฉพาะผลที่สำเร็จ ผลที่ fail ไม่จำ client แก้แล้ว retry ด้วย key เดิมได้
+    MaxSize = 1000
+    TTL = timedelta(hours=24)
+
+    def __init__(self, max_size=MaxSize, ttl=TTL):
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__entries = OrderedDict()  # key -> (เวลาที่เก็บ, request, result)
+        self.__lock = threading.Lock()
+
+    def __remove_expired(self, now: datetime):
+        while self.__entries:
+            key, (stored_at, _, _) = next(iter(self.__entries.items()))
+            if now - stored_at < self.__ttl:
+                break
+            del self.__entries[key]
+
+    def get(self, key, now: datetime = None):
+        # คืน (request, result) ที่เก็บไว้ หรือ None ถ้าไม่มี/หมดอายุแล้ว
+        if now == None:
+            now = datetime.now()
+        with self.__lock:
+            self.__remove_expired(now)
+            entry = self.__entries.get(key)
+            if entry == None:
+                return None
+            return entry[1], entry[2]
+
+    def put(self, key, request, result, now: datetime = None):
+        if now == None:
+            now = datetime.now()
+        with self.__lock:
+            self.__remove_expired(now)
+            self.__entries.pop(key, None)
+            self.__entries[key] = (now, request, result)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
+
+
 # Clinic Controller Class
 class Clinic:
+    # ลำดับการล็อก (ห้ามล็อกย้อนลำดับ เพื่อไม่ให้เกิด deadlock)
+    # prune -> customer -> staff allocator -> employee / room -> room occupancy index
+    # ล็อกลูกค้าได้ทีละคนเท่านั้น ส่วน waitlist, reservation และ idempotency cache เป็นล็อกสุดท้ายเสมอ
+    PruneInterval = timedelta(minutes=30)
+    PromoteBatch = 16  # ดึงคนจาก waitlist มาลองจองทีละกี่คนตอนมีที่ว่าง
+
     def __init__(self):
-        self.__customer = []
-        self.__employee = []
+        # ID -> object เพื่อให้ค้นหาได้ O(1)
+        self.__customer = {}
+        self.__employee = {}
         self.__rooms = []
-        self.__reservation = []
-        self.__pet = []
+        self.__room_occupancy = RoomOccupancyIndex()
+        self.__reservation = {}  # reservation_id -> reservation ที่ยังไม่หมดเวลา
+        self.__reservation_history = []
+        self.__reservation_lock = threading.Lock()
+        self.__prune_lock = threading.Lock()
+        self.__last_prune = datetime.now()
+        self.__prune_metrics = {
+            "runs": 0,
+            "schedule_slots": 0,
+            "customer_reservations": 0,
+            "clinic_reservations": 0,
+            "waitlist_entries": 0,
+            "last_run": None,
+        }
+        self.__pet = {}
+        self.__doctor_allocator = StaffAllocator()
+        self.__groomer_allocator = StaffAllocator()
+        self.__waitlist = Waitlist()
+        self.__open_bills = OpenBillIndex()  # ลูกค้าที่มีบิลค้างจ่าย ใช้สรุปยอดตอนปิดร้าน
+        self.__pricing = PricingRules()
+        self.__idempotency = IdempotencyCache()
+        self.__ledger = Ledger()  # ทุกการเติมเงิน/จ่ายเงินของคลินิก
+        self.__payments = {}  # payment_id -> Payment ใช้ export ใบเสร็จตาม ledger
         self.__medical_service = []
         self.__notification = Notification()
         self._setup_dummy_data()
 
     def _setup_dummy_data(self):
-        self.__employee.append(Doctor("D01", "Dr.Strange"))
-        self.__rooms.append(PrivateRoom("PR01"))
-        self.__rooms.append(PrivateRoom("PR02"))
-        self.__rooms.append(PrivateRoom("PR03"))
-        self.__rooms.append(ShareRoom("SR01"))
-        self.__rooms.append(ShareRoom("SR02"))
+        self.add_employee(Doctor("D01", "Dr.Strange"))
+        self.add_employee(Groomer("G01", "Edward Scissorhands"))
+        self.add_employee(Groomer("G02", "Edna Mode"))
+        self.add_room(PrivateRoom("PR01"))
+        self.add_room(PrivateRoom("PR02"))
+        self.add_room(PrivateRoom("PR03"))
+        self.add_room(ShareRoom("SR01"))
+        self.add_room(ShareRoom("SR02"))
 
         # payment = None
         c1 = PlatinumMember("C01", "Pingtale", "0999999999",
@@ -814,12 +1977,11 @@ class Clinic:
         p1 = Pet("P01", "Niggy", "Dog", "Golden", 25, "C01")
         c1.add_pet(p1)
         c1.add_card(Card("1234-5678"))
-        c1.deposit_to_card("1234-5678", 50000)
         self.add_customer(c1)
+        self.deposit_to_card("C01", "1234-5678", 50000)
         self.add_pet(p1)
-        self.add_point(c1, 50000)
-        for i in range(5):
-            self.point_to_coupon("C01")
+        self.add_point(c1, Money.from_baht(50000))
+        self.exchange_coupons("C01", 5)
 
         for i in range(9):
             c1.add_count_to_rewards_card()
@@ -829,38 +1991,56 @@ class Clinic:
         p2 = Pet("P02", "Muffy", "Cat", "Siamese", 15, "C02")
         c2.add_pet(p2)
         c2.add_card(Card("1111-1111"))
-        c2.deposit_to_card("1111-1111", 50000)
         self.add_customer(c2)
+        self.deposit_to_card("C02", "1111-1111", 50000)
         self.add_pet(p2)
         for i in range(5):
             c2.add_count_for_use_discount()
 
     # make service ในส่วน Grooming หรือ Boarding
-    def record_service(self, customer_id, pet_id):
+    def record_service(self, customer_id, pet_id, groomer_id=None):
         customer = self.get_customer_info(customer_id)
         if customer == None:
             return {"Status": "Error", "Message": "Customer is not found"}
-        pet = customer.get_pet_info(pet_id)
-        if pet == None:
-            return {"Status": "Error", "Message": "Pet does not belong to owner"}
+        with customer.lock:
+            pet = customer.get_pet_info(pet_id)
+            if pet == None:
+                return {"Status": "Error", "Message": "Pet does not belong to owner"}
+            if groomer_id and self.get_groomer_info(groomer_id) == None:
+                return {"Status": "Error", "Message": "Groomer is not found"}
+
+            big_service = pet.search_unpaid_service()
+            if big_service != None and big_service.check_has_grooming_service():
+                return {"Status": "Error", "Message": "Grooming service for today already create"}
+
+            # ถ้ามีการจองไว้วันนี้ใช้ช่างที่จองไว้ ไม่งั้นเป็น walk-in ต้องหาช่างที่ว่างตอนนี้
+            now = datetime.now().replace(second=0, microsecond=0)
+            reservation = self.find_grooming_reservation(customer, pet, now.date())
+            if reservation != None:
+                groomer = reservation.groomer
+            else:
+                groomer = self.__groomer_allocator.allocate(
+                    now, now + timedelta(hours=1), groomer_id)
+                if groomer == None:
+                    return {"Status": "Error", "Message": "No groomer available right now"}
 
-        grooming = GroomingService(pet)
-        big_service = pet.search_unpaid_service()
+            grooming = GroomingService(
+                pet, self.get_pricing_rules().grooming_price(pet.aggressive), groomer)
+            groomer.add_grooming_service(grooming)
 
-        if big_service == None:
-            big_service = RecordService(
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-            pet.append_big_service(big_service)
-        if big_service.check_has_grooming_service():
-            return {"Status": "Error", "Message": "Grooming service for today already create"}
-        big_service.append_sub_service(grooming)
+            if big_service == None:
+                big_service = RecordService(
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                pet.append_big_service(big_service)
+            big_service.append_sub_service(grooming)
 
-        return {
-            "status": "success",
-            "customer_id": customer_id,
-            "pet_id": pet.id,
-            "service": "grooming",
-        }
+            return {
+                "status": "success",
+                "customer_id": customer_id,
+                "pet_id": pet.id,
+                "service": "grooming",
+                "groomer": groomer.name,
+            }
 
     def register_card(self, customer_id, money):
         customer = self.get_customer_info(customer_id)
@@ -869,39 +2049,145 @@ class Clinic:
                 "Status": "fail",
                 "Message": "Please register customer first !",
             }
-        card_id = self.generate_ID()
-        card = Card(card_id)
-        card.deposit(money)
-        customer.add_card(card)
-        return {
-            "Status": "success",
-            "Customer_id": customer_id,
-            "Card_id": card_id,
-            "Money": money
-        }
+        try:
+            if Money.from_baht(money) < Money(0):
+                return {"Status": "fail", "Message": "Deposit must not be negative"}
+        except (ValueError, TypeError):
+            return {"Status": "fail", "Message": "Invalid money"}
+        with customer.lock:
+            card_id = self.generate_ID()
+            card = Card(card_id)
+            customer.add_card(card)
+            self.deposit_to_card(customer_id, card_id, money)
+            return {
+                "Status": "success",
+                "Customer_id": customer_id,
+                "Card_id": card_id,
+                "Money": money
+            }
 
-    def add_pet(self, pet):
-        self.__pet.append(pet)
+    # เติมเงินเข้าบัตรต้องผ่านตรงนี้ จะได้มีบันทึกใน ledger
+    def deposit_to_card(self, customer_id, card_id, money):
+        customer = self.get_customer_info(customer_id)
+        if customer == None:
+            return {"Status": "fail", "Message": "Customer not found"}
+        try:
+            amount = Money.from_baht(money)
+        except (ValueError, TypeError):
+            return {"Status": "fail", "Message": "Invalid money"}
+        if amount < Money(0):
+            return {"Status": "fail", "Message": "Deposit must not be negative"}
+        with customer.lock:
+            card = customer.search_card(card_id)
+            if card == None:
+                return {"Status": "fail", "Message": "Card not found"}
+            card.deposit(amount)
+            self.__ledger.append(LedgerEntry.Deposit, customer.id,
+                                 amount, card.get_payment_type, card.get_id)
+            return {
+                "Status": "success",
+                "Customer_id": customer.id,
+                "Card_id": card.get_id,
+                "Money": amount.to_baht(),
+                "Balance": card.total_card_money.to_baht()
+            }
 
-    def add_customer(self, customer):
-        self.__customer.append(customer)
+    def record_ledger_payment(self, kind, customer, method, price, payment_id):
+        card_id = None
+        if isinstance(method, Card):
+            card_id = method.get_id
+        return self.__ledger.append(kind, customer.id, price,
+                                    method.get_payment_type, card_id, payment_id)
 
-    def get_pet_info(self, petID):
-        for i in self.__pet:
-            if i.id == petID:
-                return i
-        return None
+    def get_card_balance(self, customer_id, card_id, time_str: str = None):
+        # ยอดบัตร ณ เวลาใดๆ สร้างจาก ledger (ไม่ใส่เวลา = ยอดปัจจุบัน)
+        customer = self.get_customer_info(customer_id)
+        if customer == None:
+            return {"status": "fail", "message": "Customer not found"}
+        if customer.search_card(card_id) == None:
+            return {"status": "fail", "message": "Card not found"}
+        at = None
+        if time_str:
+            try:
+                at = datetime.strptime(time_str, "%Y-%m-%d %H:%M")
+            except ValueError:
+                return {"status": "fail", "message": "Invalid datetime format"}
+        balance = self.__ledger.get_card_balance(card_id, at)
+        return {
+            "status": "success",
+            "card_id": card_id,
+            "time": time_str if time_str else datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "balance": balance.to_baht()
+        }
 
-    def get_customer_info(self, customer_id):
-        for i in self.__customer:
-            if i.id == customer_id:
-                return i
-        return None
+    def get_revenue(self, time_start: str, time_end: str):
+        time_format = "%Y-%m-%d %H:%M"
+        try:
+            start_dt = datetime.strptime(time_start, time_format)
+            end_dt = datetime.strptime(time_end, time_format)
+        except ValueError:
+            return {"status": "fail", "message": "Invalid datetime format"}
+        if end_dt <= start_dt:
+            return {"status": "fail", "message": "End time must be after start time."}
+
+        revenue, entry_count = self.__ledger.get_revenue(start_dt, end_dt)
+        total = revenue[LedgerEntry.Charge] + \
+            revenue[LedgerEntry.PrepaidHotel] - revenue[LedgerEntry.Refund]
+        return {
+            "status": "success",
+            "time_start": time_start,
+            "time_end": time_end,
+            "service_charge": revenue[LedgerEntry.Charge].to_baht(),
+            "prepaid_hotel": revenue[LedgerEntry.PrepaidHotel].to_baht(),
+            "refund": revenue[LedgerEntry.Refund].to_baht(),
+            "total_revenue": total.to_baht(),
+            "ledger_entries": entry_count
+        }
+
+    def add_pet(self, pet):
+        self.__pet[pet.id] = pet
+
+    def add_customer(self, customer):
+        self.__customer[customer.id] = customer
+        self.__open_bills.add_customer(customer)
+
+    def add_employee(self, employee):
+        self.__employee[employee.emp_id] = employee
+        if isinstance(employee, Doctor):
+            self.__doctor_allocator.add_staff(employee)
+        elif isinstance(employee, Groomer):
+            self.__groomer_allocator.add_staff(employee)
+
+    def add_room(self, room):
+        self.__rooms.append(room)
+        self.__room_occupancy.add_room(room)
+
+    def get_pet_info(self, petID):
+        return self.__pet.get(petID)
+
+    def get_customer_info(self, customer_id):
+        return self.__customer.get(customer_id)
+
+    def get_employee_info(self, emp_id):
+        return self.__employee.get(emp_id)
 
     def get_doctor_info(self, doctor_id):
-        for d in self.__employee:
-            if d.emp_id == doctor_id:
-                return d
+        employee = self.__employee.get(doctor_id)
+        if isinstance(employee, Doctor):
+            return employee
+        return None
+
+    def get_groomer_info(self, groomer_id):
+        employee = self.__employee.get(groomer_id)
+        if isinstance(employee, Groomer):
+            return employee
+        return None
+
+    def find_grooming_reservation(self, customer, pet, day):
+        for reservation in customer.reservation:
+            if isinstance(reservation, GroomingReservation):
+                if reservation.pet == pet and reservation.time.date() == day:
+                    return reservation
         return None
 
     def check_member(self, customer):
@@ -911,6 +2197,7 @@ class Clinic:
             return False
 
     def get_customer_reservations(self, customer_id: str):
+        self.prune_expired_if_due()
         customer = self.get_customer_info(customer_id)
         if not customer:
             return {"status": "fail", "message": "Customer not found"}
@@ -930,7 +2217,7 @@ class Clinic:
                 res_info["type"] = "Hotel"
                 res_info["check_in"] = start_dt.strftime("%Y-%m-%d")
                 res_info["check_out"] = end_dt.strftime("%Y-%m-%d")
-                res_info["price"] = res.price
+                res_info["price"] = res.price.to_baht()
                 res_info["payment_status"] = "PAID"
 
             elif isinstance(res, MedicalReservation):
@@ -943,15 +2230,21 @@ class Clinic:
             elif isinstance(res, GroomingReservation):
                 res_info["type"] = "Grooming"
                 res_info["time"] = res.time.strftime("%Y-%m-%d %H:%M")
+                res_info["groomer"] = res.groomer.name
 
             res_list.append(res_info)
 
+        waitlist = []
+        for entry in self.__waitlist.get_customer_entries(customer):
+            waitlist.append(entry.get_details())
+
         return {
             "status": "success",
             "customer_id": customer.id,
             "customer_name": customer.name,
             "total_reservations": len(res_list),
-            "reservations": res_list
+            "reservations": res_list,
+            "waitlist": waitlist
         }
 
     def register_customer(self, data: RegisterRequest):
@@ -973,7 +2266,7 @@ class Clinic:
                 "Status": "fail",
                 "Message": "invalid tier (tier must be silver/gold/platinum)"
             }
-        self.__customer.append(customer)
+        self.add_customer(customer)
         return {
             "Status": "success",
             "Customer_id": customer_id,
@@ -990,7 +2283,7 @@ class Clinic:
             pet = Pet(petID, data.pet_name, data.type_pet, data.species,
                       data.weight, data.customer_id, data.aggressive)
             customer.add_pet(pet)
-            self.__pet.append(pet)
+            self.add_pet(pet)
 
             return {
                 "Status": "success",
@@ -1018,14 +2311,263 @@ class Clinic:
             method = customer.search_card(card_ID)
         return method
 
+    def normalize_room_type(self, room_type):
+        # เผื่อใส่ไม่ตรง format
+        room_type = room_type.lower()
+        # Not have VIP or let Vip be privateroom
+        # We only have privateroom and shareroom.
+        if room_type == "private":
+            room_type = "privateroom"
+        elif room_type == "share":
+            room_type = "shareroom"
+
+        if room_type != "privateroom" and room_type != "shareroom":
+            return None
+        return room_type
+
+    def search_available_rooms(self, time_start: str, time_end: str, room_type=None):
+        start_dt, end_dt = self.convert_str_to_time(time_start, time_end)
+        if start_dt == None or end_dt <= start_dt:
+            return {"status": "fail", "message": "Invalid date range"}
+
+        if room_type:
+            room_type = self.normalize_room_type(room_type)
+            if room_type == None:
+                return {
+                    "status": "fail",
+                    "message": "Room type must be PrivateRoom or ShareRoom",
+                }
+
+        available, to_confirm = self.__room_occupancy.search_available_rooms(
+            start_dt, end_dt, room_type)
+        # เช็คห้องที่ดูเต็มกับตารางจริงนอก lock ของ index (ลำดับการล็อก room -> index)
+        for room in to_confirm:
+            remaining = room.get_remaining_capacity(start_dt, end_dt)
+            if remaining > 0:
+                available.append((room, remaining))
+        available.sort(key=lambda item: item[0].room_id)
+
+        available_rooms = []
+        for room, remaining in available:
+            available_rooms.append({
+                "room_id": room.room_id,
+                "room_type": room.room_type,
+                "price_per_day": self.get_room_price(room).to_baht(),
+                "remaining_capacity": remaining,
+            })
+
+        return {
+            "status": "success",
+            "date_start": start_dt.date(),
+            "date_end": end_dt.date(),
+            "total_available": len(available_rooms),
+            "rooms": available_rooms,
+        }
+
+    def find_available_slots(self, service_type, time_start: str, time_end: str = None, room_type=None, count=3):
+        start_dt, end_dt = self.convert_str_to_time(time_start, time_end)
+        if start_dt == None or end_dt <= start_dt:
+            return {"status": "fail", "message": "Invalid datetime format or range"}
+        duration = end_dt - start_dt
+        time_format = "%Y-%m-%d %H:%M"
+
+        # (เวลาเริ่ม, ลำดับรอง, resource_id, ชื่อ, เวลาจบ) เรียงเวลาเร็วสุดก่อน
+        candidates = []
+        if service_type.lower() == "medical" or service_type.lower() == "grooming":
+            if service_type.lower() == "medical":
+                allocator = self.__doctor_allocator
+            else:
+                allocator = self.__groomer_allocator
+            for emp in allocator.get_all_staff():
+                for slot_start, slot_end in emp.find_free_timeslot(start_dt, duration, count):
+                    load = allocator.get_booked_minutes(emp, slot_start.date())
+                    candidates.append(
+                        (slot_start, load, emp.emp_id, emp.name, slot_end))
+
+        elif service_type.lower() == "hotel":
+            if room_type:
+                room_type = self.normalize_room_type(room_type)
+                if room_type == None:
+                    return {
+                        "status": "fail",
+                        "message": "Room type must be PrivateRoom or ShareRoom",
+                    }
+            for room in self.__rooms:
+                if room_type and room.room_type != room_type:
+                    continue
+                for slot_start, slot_end in room.find_free_slots(start_dt, duration, count):
+                    candidates.append(
+                        (slot_start, self.get_room_price(room), room.room_id, room.room_type, slot_end))
+
+        else:
+            return {"status": "fail", "message": "Service type must be Hotel, Medical or Grooming"}
+
+        candidates.sort()
+        suggestions = []
+        for slot_start, _, resource_id, resource_name, slot_end in candidates[:count]:
+            suggestions.append({
+                "resource_id": resource_id,
+                "resource": resource_name,
+                "datetime_start_str": slot_start.strftime(time_format),
+                "datetime_end_str": slot_end.strftime(time_format),
+            })
+
+        return {
+            "status": "success",
+            "service_type": service_type,
+            "total_suggestions": len(suggestions),
+            "suggestions": suggestions,
+        }
+
+    def prune_expired(self, now: datetime = None):
+        # ย้ายตารางเวลาและการจองที่จบไปแล้วออกจากโครงสร้างที่ใช้งานอยู่
+        if now == None:
+            now = datetime.now()
+        with self.__prune_lock:
+            return self.__prune_expired(now)
+
+    def __prune_expired(self, now: datetime):
+        schedule_slots = 0
+        for emp in list(self.__employee.values()):
+            schedule_slots += emp.prune_timeslot(now)
+        for room in list(self.__rooms):
+            schedule_slots += room.prune_schedule(now)
+        self.__room_occupancy.prune_before(now.date())
+        self.__doctor_allocator.prune_before(now.date())
+        self.__groomer_allocator.prune_before(now.date())
+
+        customer_reservations = 0
+        for customer in list(self.__customer.values()):
+            with customer.lock:
+                customer_reservations += customer.archive_expired_reservations(
+                    now)
+
+        expired_ids = []
+        with self.__reservation_lock:
+            for reservation_id, reservation in self.__reservation.items():
+                if reservation.is_expired(now):
+                    expired_ids.append(reservation_id)
+            for reservation_id in expired_ids:
+                self.__reservation_history.append(
+                    self.__reservation.pop(reservation_id))
+
+        waitlist_entries = self.__waitlist.prune_before(now)
+
+        self.__last_prune = now
+        self.__prune_metrics["runs"] += 1
+        self.__prune_metrics["schedule_slots"] += schedule_slots
+        self.__prune_metrics["customer_reservations"] += customer_reservations
+        self.__prune_metrics["clinic_reservations"] += len(expired_ids)
+        self.__prune_metrics["waitlist_entries"] += waitlist_entries
+        self.__prune_metrics["last_run"] = now.strftime("%Y-%m-%d %H:%M:%S")
+        return {
+            "schedule_slots": schedule_slots,
+            "customer_reservations": customer_reservations,
+            "clinic_reservations": len(expired_ids),
+            "waitlist_entries": waitlist_entries,
+        }
+
+    def get_waitlist_key(self, service_type, room_type=None):
+        service_type = service_type.lower()
+        if service_type == "hotel":
+            return f"hotel:{room_type}"
+        return service_type
+
+    def get_waitlist_priority(self, customer):
+        # platinum ได้ก่อน แล้วค่อย gold, silver, ลูกค้าทั่วไป
+        if self.check_member(customer):
+            tier = customer.get_tier
+            if tier == "platinum":
+                return 0
+            elif tier == "gold":
+                return 1
+            elif tier == "silver":
+                return 2
+        return 3
+
+    def add_to_waitlist(self, customer, pet, service_type, time_start: datetime, time_end: datetime,
+                        room_type=None, payment_method=None, card_id=None, doctor_id=None):
+        entry = WaitlistEntry(
+            self.generate_ID(), customer, pet, service_type.lower(), time_start, time_end,
+            room_type, payment_method, card_id, doctor_id,
+            self.get_waitlist_priority(customer))
+        self.__waitlist.add(self.get_waitlist_key(
+            service_type, room_type), entry)
+        return entry
+
+    def leave_waitlist(self, customer_id, waitlist_id):
+        entry = self.__waitlist.get(waitlist_id)
+        if entry == None or entry.customer.id != customer_id:
+            return {"status": "fail", "message": f"{waitlist_id} not found in waitlist"}
+        self.__waitlist.remove(waitlist_id)
+        return {"status": "success", "message": f"Waitlist {waitlist_id} has been removed."}
+
+    def promote_waitlist(self, service_type, room_type, time_start: datetime, time_end: datetime):
+        # มีที่ว่างคืนมา ลองจองให้คนที่รออยู่ตามลำดับ ดึงจากคิวทีละ PromoteBatch คน
+        time_format = "%Y-%m-%d %H:%M"
+        promoted = []
+        tried = set()
+        key = self.get_waitlist_key(service_type, room_type)
+        while True:
+            batch = self.__waitlist.get_candidates(
+                key, time_start, time_end, self.PromoteBatch, tried)
+            if not batch:
+                return promoted
+            for entry in batch:
+                tried.add(entry.waitlist_id)
+                result = self.create_reservation(
+                    entry.customer.id,
+                    entry.pet.id,
+                    entry.service_type,
+                    entry.time_start.strftime(time_format),
+                    entry.time_end.strftime(time_format),
+                    entry.room_type,
+                    entry.payment_method,
+                    entry.card_id,
+                    doctor_id=entry.doctor_id,
+                    join_waitlist=False
+                )
+                if result.get("status") == "success":
+                    self.__waitlist.remove(entry.waitlist_id)
+                    promoted.append(result["reservation_id"])
+
+    def prune_expired_if_due(self):
+        # lazy pruning: ทำเมื่อผ่านไปนานกว่า PruneInterval นับจากครั้งล่าสุด
+        # ถ้ามี thread อื่นกำลัง prune อยู่ก็ข้ามไปเลย ไม่ต้องรอ
+        now = datetime.now()
+        if now - self.__last_prune < self.PruneInterval:
+            return
+        if self.__prune_lock.acquire(blocking=False):
+            try:
+                self.__prune_expired(now)
+            finally:
+                self.__prune_lock.release()
+
+    def get_prune_metrics(self):
+        with self.__prune_lock:
+            return dict(self.__prune_metrics)
+
     def generate_ID(self):
         ID = uuid.uuid4().hex[:8]
         return ID
 
+    # ราคาทั้งหมดมาจาก pricing_rules.json ถ้าไฟล์เปลี่ยนจะโหลดใหม่เอง
+    def get_pricing_rules(self):
+        self.__pricing.reload_if_changed()
+        return self.__pricing
+
+    def reload_pricing_rules(self):
+        result = self.__pricing.reload()
+        result["rules"] = self.__pricing.get_rules()
+        return result
+
+    def get_room_price(self, room):
+        return self.get_pricing_rules().room_price(room.room_type)
+
     def calculate_point(self, price):
-        rate = 0.01
-        point = rate * price
-        point_int = math.floor(point)
+        # rate เป็น basis points, ได้แต้มเต็มหน่วยปัดลง
+        rate = self.get_pricing_rules().point_rate()
+        point_int = (price.satang * rate) // (Money.BasisPoint * Money.SatangPerBaht)
         return point_int
 
     def add_point(self, customer, price):
@@ -1055,24 +2597,46 @@ class Clinic:
             return "Not found customer"
 
     def point_to_coupon(self, customer_id):
+        result = self.exchange_coupons(customer_id, 1)
+        if result["status"] == "success":
+            return "Success"
+        return result["message"]
+
+    def exchange_coupons(self, customer_id, count=1):
+        # แลกแต้มเป็นคูปองทีละหลายใบ count = จำนวนใบ หรือ "max" = เท่าที่แต้มพอ
+        # ตัดแต้มและเพิ่มคูปองพร้อมกันใต้ lock ของลูกค้า ได้ครบทุกใบหรือไม่ได้เลย
         customer = self.get_customer_info(customer_id)
-        if customer != None:
-            if self.check_member(customer):
-                tier = customer.get_tier
-                if tier == "silver":
-                    return "silver tier cannot use coupon"
-                point = customer.point
-                if point >= 50:
-                    coupon = self.create_coupon()
-                    customer.add_coupon(coupon)
-                    customer.remove_point(50)
-                    return "Success"
-                else:
-                    return "Not enough point"
-            else:
-                return "Not Member"
-        else:
-            return "Not found customer"
+        if customer == None:
+            return {"status": "fail", "message": "Not found customer"}
+        if count != "max" and (isinstance(count, bool) or not isinstance(count, int) or count <= 0):
+            return {"status": "fail", "message": "count must be more than 0 or 'max'"}
+
+        with customer.lock:
+            if not self.check_member(customer):
+                return {"status": "fail", "message": "Not Member"}
+            if customer.get_tier == "silver":
+                return {"status": "fail", "message": "silver tier cannot use coupon"}
+
+            point_cost = self.get_pricing_rules().coupon_point_cost()
+            affordable = customer.point // point_cost if point_cost > 0 else None
+            if count == "max":
+                if affordable == None:
+                    return {"status": "fail", "message": "count must be a number when coupons cost no point"}
+                count = affordable
+            if count == 0 or (affordable != None and count > affordable):
+                return {"status": "fail", "message": "Not enough point"}
+
+            coupon = self.create_coupon()
+            customer.add_coupon(coupon, count)
+            customer.remove_point(point_cost * count)
+            return {
+                "status": "success",
+                "coupon_id": coupon.id,
+                "exchanged": count,
+                "point_used": point_cost * count,
+                "point_left": customer.point,
+                "coupon_total": customer.coupon_count
+            }
 
     def reward_card_count(self, customer_id):
         customer = self.get_customer_info(customer_id)
@@ -1093,11 +2657,17 @@ class Clinic:
         if discount <= price:
             new_price = price - discount
         else:
-            new_price = 0
+            new_price = Money(0)
         return new_price
 
     def pay(self, total_price, method, money=None):
         if method.get_payment_type == "qrcode":
+            if money != None:
+                # เงินที่โอนมาเป็นบาท แปลงเป็นสตางค์ก่อนเทียบ
+                try:
+                    money = Money.from_baht(money)
+                except (ValueError, TypeError):
+                    return "Invalid money"
             result = method.validate_money(total_price, money)
             if result == False:
                 return "Invalid money"
@@ -1109,8 +2679,8 @@ class Clinic:
             method.total_card_money = money - total_price
         return "Success"
 
-    def set_paid_to_service(self, service):
-        service.is_paid = True
+    def set_paid_to_service(self, pet):
+        return pet.mark_service_paid()
 
     def create_service_and_pet_list(self, pet_list):
         list_pet_and_service = []
@@ -1121,27 +2691,173 @@ class Clinic:
                 list_pet_and_service.append([pet.name, service_list])
         return list_pet_and_service
 
-    def create_payment(self, customer_id, method, price, list_pet_and_service, today, point=0):
-        payment_ID = self.generate_ID()
+    def create_payment(self, customer_id, method, price, list_pet_and_service, today, point=0, payment_ID=None):
+        if payment_ID == None:
+            payment_ID = self.generate_ID()
         payment = Payment(customer_id, payment_ID, method,
                           price, list_pet_and_service, today, point)
         return payment
 
-    def start_calculate_total_price(self, customer_id, use_cp, use_rw_card, pay=False):
+    def add_payment(self, customer, payment):
+        customer.add_payment(payment)
+        self.__payments[payment.payment_id] = payment
+
+    def export_receipts(self, time_start: str = None, time_end: str = None):
+        # ใบเสร็จแบบย่อบรรทัดละใบ (JSON lines) เรียงตามเวลาใน ledger
+        time_format = "%Y-%m-%d %H:%M"
+        try:
+            start_dt = datetime.strptime(time_start, time_format) if time_start else None
+            end_dt = datetime.strptime(time_end, time_format) if time_end else None
+        except ValueError:
+            return {"status": "fail", "message": "Invalid datetime format"}
+
+        lines = []
+        # split payment ลง ledger ทีละ tender ด้วย payment_id เดียวกัน ออกใบเสร็จครั้งเดียวพอ
+        exported = set()
+        for entry in self.__ledger.get_entries(start_dt, end_dt):
+            if entry.payment_id in exported:
+                continue
+            payment = self.__payments.get(entry.payment_id)
+            if payment != None:
+                exported.add(entry.payment_id)
+                lines.append(payment.to_compact())
+        return {
+            "status": "success",
+            "schema_version": ReceiptSchemaVersion,
+            "format": "compact-jsonl",
+            "count": len(lines),
+            "data": "\n".join(lines)
+        }
+
+    def get_pet_bill_page(self, pet_id, cursor=None, limit=50, time_start: str = None, time_end: str = None):
+        # ประวัติบิลของ pet ทีละหน้า เรียงตามวันที่ ช่วง [time_start, time_end)
+        # cursor = "bill_time|bill_no" ของบิลสุดท้ายในหน้าก่อน
+        pet = self.get_pet_info(pet_id)
+        if pet == None:
+            return {"status": "fail", "message": "Pet not found"}
+        if limit <= 0:
+            return {"status": "fail", "message": "limit must be more than 0"}
+
+        time_format = "%Y-%m-%d %H:%M"
+        try:
+            start_dt = datetime.strptime(time_start, time_format) if time_start else None
+            end_dt = datetime.strptime(time_end, time_format) if time_end else None
+            after = None
+            if cursor:
+                bill_time, bill_no = cursor.rsplit("|", 1)
+                after = (datetime.fromisoformat(bill_time), int(bill_no))
+        except ValueError:
+            return {"status": "fail", "message": "Invalid datetime format or cursor"}
+
+        customer = self.get_customer_info(pet.customer_id)
+        if customer == None:
+            return {"status": "fail", "message": "Customer not found"}
+
+        with customer.lock:
+            history = []
+            next_cursor = None
+            last = None
+            # สร้างรายละเอียดเฉพาะบิลในหน้านี้ ดูบิลถัดไปแค่ใบเดียวเพื่อรู้ว่ายังมีหน้าต่อไหม
+            for bill_time, bill_no, big_service in pet.iter_bills(start_dt, end_dt, after):
+                if len(history) == limit:
+                    next_cursor = f"{last[0].isoformat()}|{last[1]}"
+                    break
+                last = (bill_time, bill_no)
+                service_date = big_service.get_date
+                if isinstance(service_date, datetime):
+                    formatted_date = service_date.strftime("%Y-%m-%d %H:%M")
+                else:
+                    formatted_date = str(service_date)
+                history.append({
+                    "bill_no": bill_no,
+                    "date_created": formatted_date,
+                    "is_paid": big_service.is_paid,
+                    "services_inside": big_service.get_service_list(),
+                    "total_price_to_pay_now": big_service.calculate_total_price().to_baht()
+                })
+            total = pet.bill_total
+
+        return {
+            "status": "success(Found)",
+            "pet_id": pet.id,
+            "pet_name": pet.name,
+            "total_service_boxes": total,
+            "count": len(history),
+            "history": history,
+            "next_cursor": next_cursor
+        }
+
+    def start_calculate_total_price(self, customer_id, use_cp, use_rw_card):
         customer = self.get_customer_info(customer_id)
         if (customer == None):
             return "Customer not found"
 
+        return self.get_customer_quote(customer, use_cp, use_rw_card)
+
+    def get_customer_quote(self, customer, use_cp=False, use_rw_card=False):
+        with customer.lock:
+            # ยอดเดิมใช้ได้จนกว่าบิล/coupon/rewards card ของลูกค้าหรือตารางราคาจะเปลี่ยน
+            pricing = self.get_pricing_rules()
+            key = (bool(use_cp), bool(use_rw_card), pricing.version)
+            price = customer.get_cached_quote(key)
+            if price == None:
+                price = self.calculate_quote(customer, use_cp, use_rw_card)
+                customer.set_cached_quote(key, price)
+            return price
+
+    # สรุปยอดค้างจ่ายตอนปิดร้าน เดินเฉพาะลูกค้าที่มีบิลค้างอยู่ แบ่งหน้าด้วย customer_id
+    def get_open_bill_quotes(self, cursor=None, limit=50):
+        if limit <= 0:
+            return {"status": "fail", "message": "limit must be more than 0"}
+
+        customer_ids, next_cursor = self.__open_bills.get_page(cursor, limit)
+        quotes = []
+        page_total = Money(0)
+        for customer_id in customer_ids:
+            customer = self.get_customer_info(customer_id)
+            if customer == None:
+                continue
+            price = self.get_customer_quote(customer)
+            # บิลที่มีแต่โรงแรมที่จ่ายตอนจองแล้ว ไม่มียอดต้องจ่าย
+            if type(price) is str:
+                continue
+            quotes.append({
+                "customer_id": customer.id,
+                "customer_name": customer.name,
+                "total_price": price.to_baht()
+            })
+            page_total += price
+
+        return {
+            "status": "success",
+            "count": len(quotes),
+            "page_total": page_total.to_baht(),
+            "quotes": quotes,
+            "next_cursor": next_cursor
+        }
+
+    def iter_open_bill_quotes(self, limit=50):
+        cursor = None
+        while True:
+            page = self.get_open_bill_quotes(cursor, limit)
+            if page["status"] != "success":
+                return
+            yield page
+            cursor = page["next_cursor"]
+            if cursor == None:
+                return
+
+    # คำนวณยอดอย่างเดียว ไม่ไปแก้ coupon หรือ rewards card ของลูกค้า
+    def calculate_quote(self, customer, use_cp, use_rw_card):
         pet_list = customer.pet
 
-        price = 0
+        price = Money(0)
         for pet in pet_list:
             service = pet.search_unpaid_service()
             if service is not None:
-                service.calculate_total_price()
-                price += service.price
+                price += service.calculate_total_price()
 
-        if price == 0:
+        if not price:
             return "No order to pay"
 
         member = self.check_member(customer)
@@ -1149,20 +2865,21 @@ class Clinic:
             if use_cp == True or use_rw_card == True:
                 return "Not a member"
         else:
+            pricing = self.get_pricing_rules()
             tier = customer.get_tier
-            rate = customer.get_rate
+            rate = pricing.tier_rate(tier)
             if tier == "silver":
                 is_limit = customer.check_is_limit()
                 if is_limit == True:
                     return price
-            discount = price*rate
+            discount = price.apply_rate(rate)
             price = self.calculate_price_with_discount(price, discount)
             if use_rw_card == True:
                 if tier == "silver" or tier == "gold":
                     return "silver/gold cannot use reward card"
-                result = customer.use_rewards_card(pay)
+                result = customer.use_rewards_card()
                 if result == True:
-                    price = 0
+                    price = Money(0)
                     return price
                 else:
                     return "rewards card not available(Must collect more than 10 times)"
@@ -1173,26 +2890,72 @@ class Clinic:
                 if coupon == None:
                     return "not have coupon"
                 else:
-                    discount = coupon.use_coupon
+                    discount = pricing.coupon_discount()
                 price = self.calculate_price_with_discount(price, discount)
         return price
 
-    def start_payment(self, customer_id, payment_type, card_ID=None, use_cp=False, use_rw_card=False, money=None):
-        price = self.start_calculate_total_price(
-            customer_id, use_cp, use_rw_card, pay=True)
-        if type(price) is str:
-            return price
+    def start_payment(self, customer_id, payment_type, card_ID=None, use_cp=False, use_rw_card=False, money=None, idempotency_key=None):
+        if not idempotency_key:
+            return self.__start_payment(customer_id, payment_type, card_ID, use_cp, use_rw_card, money)
 
         customer = self.get_customer_info(customer_id)
-        method = self.get_payment_method_object(
-            customer, payment_type, card_ID)
-        if method == None:
-            return "Invalid CardID"
+        if customer == None:
+            return "Customer not found"
 
-        result = self.pay(price, method, money)
-        if result != "Success":
+        # ล็อกลูกค้าไว้ก่อนเช็ค cache ถ้า retry มาพร้อมกันตัวหลังจะรอแล้วได้ผลของตัวแรก
+        with customer.lock:
+            key = ("payment", customer_id, idempotency_key)
+            request = (payment_type, card_ID, bool(use_cp), bool(use_rw_card), money)
+            cached = self.__idempotency.get(key)
+            if cached != None:
+                cached_request, result = cached
+                if cached_request != request:
+                    return "Idempotency key was already used for a different payment"
+                return result
+            result = self.__start_payment(customer_id, payment_type, card_ID, use_cp, use_rw_card, money)
+            # จำเฉพาะใบเสร็จที่จ่ายสำเร็จ error เป็น string ให้ retry ด้วย key เดิมได้
+            if not isinstance(result, str):
+                self.__idempotency.put(key, request, result)
             return result
 
+    def __start_payment(self, customer_id, payment_type, card_ID=None, use_cp=False, use_rw_card=False, money=None):
+        customer = self.get_customer_info(customer_id)
+        if customer == None:
+            return "Customer not found"
+
+        with customer.lock:
+            # ใช้ยอดเดียวกับที่ลูกค้าเพิ่งเห็นจาก calculate_price ถ้ายังไม่มีอะไรเปลี่ยน
+            price = self.start_calculate_total_price(
+                customer_id, use_cp, use_rw_card)
+            if type(price) is str:
+                return price
+
+            method = self.get_payment_method_object(
+                customer, payment_type, card_ID)
+            if method == None:
+                return "Invalid CardID"
+
+            result = self.pay(price, method, money)
+            if result != "Success":
+                return result
+            payment_ID = self.generate_ID()
+            self.record_ledger_payment(
+                LedgerEntry.Charge, customer, method, price, payment_ID)
+
+            point, pet_service_list = self.settle_paid_bills(
+                customer, price, use_rw_card)
+            today = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            payment = self.create_payment(
+                customer_id, method, price, pet_service_list, today, point, payment_ID)
+            self.add_payment(customer, payment)
+            return payment.create_receipt().model_dump()
+
+    def settle_paid_bills(self, customer, price, use_rw_card):
+        # หลังตัดเงินสำเร็จ: ตัด rewards card, ให้แต้ม/นับสิทธิ์ แล้วปิดบิลของทุก pet
+        if use_rw_card == True:
+            customer.use_rewards_card(pay=True)
+
+        point = 0
         member = self.check_member(customer)
         if member:
             point = self.add_point(customer, price)
@@ -1204,14 +2967,115 @@ class Clinic:
         pet_list = customer.pet
         pet_service_list = self.create_service_and_pet_list(pet_list)
         for pet in pet_list:
-            service = pet.search_unpaid_service()
-            self.set_paid_to_service(service)
+            self.set_paid_to_service(pet)
+        return point, pet_service_list
+
+    def plan_split_tender(self, customer, price, card_ids=None, qr_money=None):
+        # ไล่บัตรรอบเดียว ตัดเท่าที่แต่ละใบมี ส่วนที่เหลือต้องจ่าย QR ให้ตรงยอด
+        # คืน (แผน [(method, Money)], error)
+        if card_ids:
+            cards = []
+            for card_id in dict.fromkeys(card_ids):
+                card = customer.search_card(card_id)
+                if card == None:
+                    return None, f"Invalid CardID: {card_id}"
+                cards.append(card)
+        else:
+            cards = customer.card
+
+        plan = []
+        remaining = price
+        for card in cards:
+            if not remaining:
+                break
+            balance = card.total_card_money
+            if balance <= Money(0):
+                continue
+            amount = min(balance, remaining)
+            plan.append((card, amount))
+            remaining -= amount
+
+        if qr_money != None:
+            try:
+                qr_money = Money.from_baht(qr_money)
+            except (ValueError, TypeError):
+                return None, "Invalid money"
+        if remaining:
+            if qr_money == None:
+                return None, f"Cards cover {(price - remaining)}, QR remainder {remaining} is required"
+            if qr_money != remaining:
+                return None, f"QR money must be exactly {remaining}"
+            plan.append((QRCode(self.generate_ID()), remaining))
+        elif qr_money:
+            return None, "Cards already cover the bill, QR money must be 0"
+        return plan, None
+
+    def start_split_payment(self, customer_id, card_ids=None, use_cp=False, use_rw_card=False, qr_money=None, idempotency_key=None):
+        customer = self.get_customer_info(customer_id)
+        if customer == None:
+            return "Customer not found"
+
+        with customer.lock:
+            if idempotency_key:
+                key = ("split_payment", customer_id, idempotency_key)
+                request = (tuple(card_ids or ()), bool(use_cp), bool(use_rw_card), qr_money)
+                cached = self.__idempotency.get(key)
+                if cached != None:
+                    cached_request, result = cached
+                    if cached_request != request:
+                        return "Idempotency key was already used for a different payment"
+                    return result
+                result = self.__start_split_payment(
+                    customer, card_ids, use_cp, use_rw_card, qr_money)
+                # จำเฉพาะใบเสร็จที่จ่ายสำเร็จ เหมือน start_payment
+                if not isinstance(result, str):
+                    self.__idempotency.put(key, request, result)
+                return result
+            return self.__start_split_payment(
+                customer, card_ids, use_cp, use_rw_card, qr_money)
+
+    def __start_split_payment(self, customer, card_ids, use_cp, use_rw_card, qr_money):
+        price = self.get_customer_quote(customer, use_cp, use_rw_card)
+        if type(price) is str:
+            return price
+
+        plan, error = self.plan_split_tender(customer, price, card_ids, qr_money)
+        if error:
+            return error
+
+        # ตัดทุกบัตรให้ผ่านทั้งหมด ถ้าใบไหนไม่ผ่านคืนเงินใบที่ตัดไปแล้ว
+        debited = []
+        for method, amount in plan:
+            if isinstance(method, Card):
+                result = self.pay(amount, method)
+            else:
+                result = self.pay(amount, method, amount)
+            if result != "Success":
+                for debited_card, debited_amount in debited:
+                    debited_card.total_card_money = debited_card.total_card_money + debited_amount
+                return result
+            if isinstance(method, Card):
+                debited.append((method, amount))
+
+        payment_ID = self.generate_ID()
+        tenders = []
+        for method, amount in plan:
+            self.record_ledger_payment(
+                LedgerEntry.Charge, customer, method, amount, payment_ID)
+            card_id = method.get_id if isinstance(method, Card) else None
+            tenders.append((method.get_payment_type, card_id, amount))
+        if not plan:
+            # ยอด 0 (ใช้ rewards card) ไม่ต้องตัดเงิน แต่ยังลง ledger ไว้ให้ export ใบเสร็จได้
+            self.__ledger.append(LedgerEntry.Charge, customer.id,
+                                 Money(0), "split", None, payment_ID)
+
+        point, pet_service_list = self.settle_paid_bills(
+            customer, price, use_rw_card)
         today = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        payment = self.create_payment(
-            customer_id, method, price, pet_service_list, today, point)
-        customer.add_payment(payment)
-        payment_slip = payment.create_payment_slip()
-        return payment_slip
+        payment = Payment(customer.id, payment_ID, None, price,
+                          pet_service_list, today, point, tenders=tenders)
+        self.add_payment(customer, payment)
+        return payment.create_receipt().model_dump()
 
     # เปลี่ยน str ให้กลายเป็น time object
     # หากไม่ได้ใส่ time_end มาให้
@@ -1227,6 +3091,216 @@ class Clinic:
         except ValueError:
             return None, None
 
+    def validate_hotel_reservation(self, customer, pet, time_end, room_type, payment_method, card_id):
+        # คืน (room_type ที่ normalize แล้ว, error) ถ้าไม่มี error จะได้ None
+        for big_service in pet.unpaid_service:
+            if "Hotel" in big_service.get_service_list():
+                return None, {
+                    "status": "fail",
+                    "message": f"Pet '{pet.name}' already has a hotel reservation"
+                }
+
+        if not payment_method:
+            return None, {
+                "status": "fail",
+                "message": "Hotel reservation requires a payment method (e.g., 'card' or 'qrcode')",
+            }
+
+        if not time_end:
+            return None, {
+                "status": "fail",
+                "message": "Hotel reservation requires a checkout time",
+            }
+
+        if not room_type:
+            return None, {
+                "status": "fail",
+                "message": "Hotel Required Room type only PrivateRoom or ShareRoom",
+            }
+
+        if payment_method.lower() == "card":
+            if not customer.card:
+                return None, {"status": "fail", "message": "Customer has no card."}
+            if card_id == None:
+                return None, {"status": "fail", "message": "Require CardID."}
+        elif payment_method.lower() == "qrcode":
+            pass
+        else:
+            return None, {"status": "fail", "message": "Invalid payment method .payment method require card or qrcode"}
+
+        room_type = self.normalize_room_type(room_type)
+        if room_type == None:
+            return None, {
+                "status": "fail",
+                "message": "Hotel Required Room type PrivateRoom or ShareRoom",
+            }
+        return room_type, None
+
+    def allocate_resource(self, service_type, time_start: datetime, time_end: datetime, room_type=None, doctor_id=None):
+        service_type = service_type.lower()
+        if service_type == "grooming":
+            return self.__groomer_allocator.allocate(time_start, time_end)
+        elif service_type == "hotel":
+            for room in self.__rooms:
+                if room_type == room.room_type and room.book_room(time_start, time_end):
+                    return room
+        elif service_type == "medical":
+            return self.__doctor_allocator.allocate(time_start, time_end, doctor_id)
+        return None
+
+    def release_resource(self, resource, time_start: datetime, time_end: datetime):
+        if isinstance(resource, Room):
+            resource.cancel_room(time_start, time_end)
+        elif isinstance(resource, Doctor):
+            self.__doctor_allocator.release(resource, time_start, time_end)
+        elif isinstance(resource, Groomer):
+            self.__groomer_allocator.release(resource, time_start, time_end)
+
+    @staticmethod
+    def get_hotel_nights(time_start: datetime, time_end: datetime):
+        original_time_duration = time_end - time_start
+        staying_time = max(1, math.ceil(
+            original_time_duration / timedelta(days=1)))
+        first_night = time_start.date()
+        return [first_night + timedelta(days=i) for i in range(staying_time)]
+
+    def get_hotel_night_prices(self, room_type, time_start: datetime, time_end: datetime, already_booked=False):
+        # ราคาแต่ละคืน = ราคาห้อง x multiplier ตาม occupancy ของคืนนั้น (นับการจองนี้ด้วยเสมอ)
+        # อ่านจากตาราง occupancy ที่อัปเดตตอน book_room / cancel_room ไม่ต้องไล่ตารางห้อง
+        # already_booked = จองห้องไปแล้ว ตารางนับคืนของการจองนี้ไว้แล้ว ห้ามนับซ้ำ
+        # คืนที่คิดเงิน (ออกช้ากว่าเวลาเข้า = เพิ่มอีกคืน) อาจมากกว่าคืนในตาราง occupancy
+        pricing = self.get_pricing_rules()
+        base_price = pricing.room_price(room_type)
+        nights = self.get_hotel_nights(time_start, time_end)
+        if not pricing.hotel_dynamic_pricing():
+            return [(night, None, base_price) for night in nights]
+        booked_list, capacity = self.__room_occupancy.get_type_occupancy(room_type, nights)
+        counted = set()
+        if already_booked:
+            counted = set(RoomOccupancyIndex.get_nights(time_start, time_end))
+        night_prices = []
+        for night, booked in zip(nights, booked_list):
+            if night not in counted:
+                booked += 1
+            booked = min(booked, capacity)
+            rate = pricing.hotel_night_multiplier(booked, capacity)
+            night_prices.append((night, (booked, capacity), base_price.apply_rate(rate)))
+        return night_prices
+
+    def calculate_hotel_price(self, room, time_start: datetime, time_end: datetime):
+        # เรียกหลังจองห้องแล้ว occupancy จึงรวมการจองนี้อยู่แล้ว
+        total = Money()
+        for _, _, price in self.get_hotel_night_prices(room.room_type, time_start, time_end, already_booked=True):
+            total += price
+        return total
+
+    def quote_hotel_price(self, time_start: str, time_end: str, room_type):
+        start_dt, end_dt = self.convert_str_to_time(time_start, time_end)
+        if start_dt == None or end_dt <= start_dt:
+            return {"status": "fail", "message": "Invalid date range"}
+        room_type = self.normalize_room_type(room_type)
+        if room_type == None:
+            return {"status": "fail", "message": "Room type must be PrivateRoom or ShareRoom"}
+
+        total = Money()
+        nights = []
+        for night, occupancy, price in self.get_hotel_night_prices(room_type, start_dt, end_dt):
+            total += price
+            detail = {"date": night, "price": price.to_baht()}
+            if occupancy != None:
+                detail["occupancy"] = f"{occupancy[0]}/{occupancy[1]}"
+            nights.append(detail)
+        return {
+            "status": "success",
+            "room_type": room_type,
+            "dynamic_pricing": self.get_pricing_rules().hotel_dynamic_pricing(),
+            "nights": nights,
+            "total_price": total.to_baht(),
+        }
+
+    def prepay_hotel(self, customer, payment_method, card_id, price, pet_service_list):
+        # จ่ายค่าโรงแรมล่วงหน้า คืน error dict ถ้าจ่ายไม่สำเร็จ
+        payment_obj = self.get_payment_method_object(
+            customer, payment_method, card_id)
+
+        if payment_obj == None:
+            return {
+                "status": "fail",
+                "message": "CardID Not Found.",
+            }
+
+        pay_result = self.pay(price, payment_obj, price)
+
+        if pay_result != "Success":
+            return {
+                "status": "fail",
+                "message": "Payment failed. Room reservation cancelled.",
+            }
+
+        # Payment Record
+        today = datetime.today()
+        payment_ID = self.generate_ID()
+        self.record_ledger_payment(
+            LedgerEntry.PrepaidHotel, customer, payment_obj, price, payment_ID)
+        point = self.add_point(customer, price)
+        payment_record = Payment(
+            customer_id=customer.id,
+            payment_ID=payment_ID,
+            method=payment_obj,
+            price=price,
+            pet_service_list=pet_service_list,
+            date=today,
+            point=point,
+            kind=LedgerEntry.PrepaidHotel
+        )
+        self.add_payment(customer, payment_record)
+        return None
+
+    def add_hotel_reservation_service(self, pet, room, time_start: datetime, time_end: datetime, price):
+        big_service = RecordService(time_start)
+        hotel_service_with_reservation = HotelService(
+            room, time_start, time_end, price, True)
+        big_service.append_sub_service(hotel_service_with_reservation)
+        pet.append_big_service(big_service)
+
+    def add_reservation(self, service_type, customer, pet, time_start: datetime, time_end: datetime, resource, price=0, payment_method=None):
+        reservation_id = str(uuid.uuid1())[:8]
+        service_type = service_type.lower()
+        if service_type == "grooming":
+            new_reservation = GroomingReservation(
+                reservation_id, customer, pet, time_start, time_end, resource
+            )
+
+        elif service_type == "hotel":
+            new_reservation = HotelReservation(
+                reservation_id,
+                customer,
+                pet,
+                time_start,
+                time_end,
+                resource,
+                price,
+                payment_method,
+            )
+
+        elif service_type == "medical":
+            new_reservation = MedicalReservation(
+                reservation_id, customer, pet, time_start, time_end, resource
+            )
+
+        with self.__reservation_lock:
+            self.__reservation[reservation_id] = new_reservation
+        customer.add_reservation(new_reservation)
+        return new_reservation
+
+    def notify_customer(self, customer, reservation_id):
+        if customer.email:
+            self.__notification.send_confirmation("EMAIL", reservation_id)
+            customer.receive_notification("EMAIL", reservation_id)
+        else:
+            self.__notification.send_confirmation("SMS", reservation_id)
+            customer.receive_notification("SMS", reservation_id)
+
     def create_reservation(
         self,
         customer_id,
@@ -1237,177 +3311,117 @@ class Clinic:
         room_type=None,
         payment_method=None,
         card_id=None,
-        money=None
+        money=None,
+        doctor_id=None,
+        join_waitlist=False,
+        idempotency_key=None
     ):
-        resource = None
-        price = 0
+        # prune ก่อนล็อกลูกค้า ตามลำดับการล็อก
+        self.prune_expired_if_due()
+        if not idempotency_key:
+            return self.__create_reservation(
+                customer_id, pet_id, service_type, time_start, time_end, room_type,
+                payment_method, card_id, money, doctor_id, join_waitlist)
+
         customer = self.get_customer_info(customer_id)
-        pet = customer.get_pet_info(pet_id)
-        if pet == None:
-            return {"Status": "Error", "Message": "Pet does not belong to owner"}
-        payment_obj = None
+        if customer == None:
+            return {"status": "fail", "message": "Customer not found"}
 
-        start_dt, end_dt = self.convert_str_to_time(time_start, time_end)
+        with customer.lock:
+            key = ("reservation", customer_id, idempotency_key)
+            request = (pet_id, service_type, time_start, time_end, room_type,
+                       payment_method, card_id, money, doctor_id, join_waitlist)
+            cached = self.__idempotency.get(key)
+            if cached != None:
+                cached_request, result = cached
+                if cached_request != request:
+                    return {
+                        "status": "fail",
+                        "message": "Idempotency key was already used for a different reservation",
+                    }
+                return result
+            result = self.__create_reservation(
+                customer_id, pet_id, service_type, time_start, time_end, room_type,
+                payment_method, card_id, money, doctor_id, join_waitlist)
+            # จำเฉพาะผลที่จองสำเร็จหรือเข้า waitlist แล้ว ผลที่ fail ให้ retry ด้วย key เดิมได้
+            if result.get("status") == "success" or "waitlist_id" in result:
+                self.__idempotency.put(key, request, result)
+            return result
 
-        if service_type.lower() == "grooming":
-            resource = "Grooming"
+    def __create_reservation(
+        self,
+        customer_id,
+        pet_id,
+        service_type,
+        time_start,
+        time_end=None,
+        room_type=None,
+        payment_method=None,
+        card_id=None,
+        money=None,
+        doctor_id=None,
+        join_waitlist=False
+    ):
+        price = Money(0)
+        customer = self.get_customer_info(customer_id)
+        if customer == None:
+            return {"status": "fail", "message": "Customer not found"}
+        with customer.lock:
+            pet = customer.get_pet_info(pet_id)
+            if pet == None:
+                return {"Status": "Error", "Message": "Pet does not belong to owner"}
 
-        elif service_type.lower() == "hotel":
+            start_dt, end_dt = self.convert_str_to_time(time_start, time_end)
 
-            for big_service in pet.service:
-                if big_service.is_paid == False:
-                    if "Hotel" in big_service.get_service_list():
-                        return {
-                            "status": "fail",
-                            "message": f"Pet '{pet.name}' already has a hotel reservation"
-                        }
+            if service_type.lower() == "hotel":
+                room_type, error = self.validate_hotel_reservation(
+                    customer, pet, time_end, room_type, payment_method, card_id)
+                if error:
+                    return error
 
-            if not payment_method:
-                return {
-                    "status": "fail",
-                    "message": "Hotel reservation requires a payment method (e.g., 'card' or 'qrcode')",
-                }
+            elif service_type.lower() == "medical":
+                if doctor_id and self.get_doctor_info(doctor_id) == None:
+                    return {"status": "fail", "message": "Doctor is not found"}
 
-            if not time_end:
-                return {
-                    "status": "fail",
-                    "message": "Hotel reservation requires a checkout time",
-                }
+            resource = self.allocate_resource(
+                service_type, start_dt, end_dt, room_type, doctor_id)
 
-            if not room_type:
-                return {
+            if resource == None:
+                suggestion = self.find_available_slots(
+                    service_type, time_start, time_end, room_type)
+                result = {
                     "status": "fail",
-                    "massage": "Hotel Required Room type only PrivateRoom or ShareRoom",
+                    "message": f"No available resource for {service_type} at {start_dt}",
+                    "suggestions": suggestion.get("suggestions", []),
                 }
+                if join_waitlist and suggestion.get("status") == "success":
+                    entry = self.add_to_waitlist(
+                        customer, pet, service_type, start_dt, end_dt,
+                        room_type, payment_method, card_id, doctor_id)
+                    result["waitlist_id"] = entry.waitlist_id
+                    result["message"] += ". Added to waitlist, the booking will be made automatically when a slot is freed."
+                return result
 
-            if payment_method.lower() == "card":
-                if not customer.card:
-                    return {"status": "fail", "message": "Customer has no card."}
-                if card_id == None:
-                    return {"status": "fail", "message": "Require CardID."}
-            elif payment_method.lower() == "qrcode":
-                pass
-            else:
-                return {"status": "fail", "message": "Invalid payment method .payment method require card or qrcode"}
-
-            original_time_duration = end_dt - start_dt
-            staying_time = max(1, math.ceil(
-                original_time_duration / timedelta(days=1)))
-
-            # เผื่อใส่ไม่ตรง format
-            room_type = room_type.lower()
-            # Not have VIP or let Vip be privateroom
-            # We only have privateroom and shareroom.
-            if room_type == "private":
-                room_type = "privateroom"
-            elif room_type == "share":
-                room_type = "shareroom"
-
-            if room_type != "privateroom" and room_type != "shareroom":
-                return {
-                    "status": "fail",
-                    "message": "Hotel Required Room type PrivateRoom or ShareRoom",
-                }
-
-            for room in self.__rooms:
-                if room_type.lower() == room.room_type and room.book_room(start_dt, end_dt):
-                    resource = room
-                    price = room.get_price * staying_time
-
-                    # print(f"days {original_time_duration.days}")
-                    # print(f"staying time {staying_time}")
-                    # print(f"price {price}")
-
-                    payment_obj = self.get_payment_method_object(
-                        customer, payment_method, card_id)
-
-                    if payment_obj == None:
-                        room.cancel_room(start_dt, end_dt)
-                        resource = None
-                        return {
-                            "status": "fail",
-                            "message": "CardID Not Found.",
-                        }
-
-                    pay_result = self.pay(price, payment_obj, price)
-
-                    if pay_result != "Success":
-                        room.cancel_room(start_dt, end_dt)
-                        resource = None
-                        return {
-                            "status": "fail",
-                            "message": "Payment failed. Room reservation cancelled.",
-                        }
-
-                    # Payment Record
-                    today = datetime.today()
-                    payment_ID = self.generate_ID()
-                    point = self.add_point(customer, price)
-                    payment_record = Payment(
-                        customer_id=customer.id,
-                        payment_ID=payment_ID,
-                        method=payment_obj,
-                        price=price,
-                        pet_service_list=[
-                            f"Pre-paid Hotel ({room.get_details()})"],
-                        date=today,
-                        point=point
-                    )
-                    customer.add_payment(payment_record)
-                    big_service = RecordService(start_dt)
-                    hotel_service_with_reservation = HotelService(
-                        resource, start_dt, end_dt, price, True)
-                    big_service.append_sub_service(
-                        hotel_service_with_reservation)
-                    pet.append_big_service(big_service)
-                    break
-
-        elif service_type.lower() == "medical":
-            for emp in self.__employee:
-                if emp.Type == "Doctor" and emp.get_avaliable_work(start_dt, end_dt):
-                    if emp.update_timeslot(start_dt, end_dt):
-                        resource = emp
-                        break
-
-        if resource:
-            reservation_id = str(uuid.uuid1())[:8]
-            if service_type.lower() == "grooming":
-                new_reservation = GroomingReservation(
-                    reservation_id, customer, pet, start_dt
-                )
-
-            elif service_type.lower() == "hotel":
-                new_reservation = HotelReservation(
-                    reservation_id,
-                    customer,
-                    pet,
-                    start_dt,
-                    end_dt,
-                    resource,
-                    price,
-                    payment_method,
-                )
-
-                # pet.add_boarding_service(resource)
-
-            elif service_type.lower() == "medical":
-                new_reservation = MedicalReservation(
-                    reservation_id, customer, pet, start_dt, end_dt, resource
-                )
-
-            self.__reservation.append(new_reservation)
-            customer.add_reservation(new_reservation)
-
-            if customer.email:
-                self.__notification.send_confirmation("EMAIL", reservation_id)
-                customer.receive_notification("EMAIL", reservation_id)
-            else:
-                self.__notification.send_confirmation("SMS", reservation_id)
-                customer.receive_notification("SMS", reservation_id)
+            if service_type.lower() == "hotel":
+                price = self.calculate_hotel_price(resource, start_dt, end_dt)
+                error = self.prepay_hotel(
+                    customer, payment_method, card_id, price,
+                    [[pet.name, [f"Pre-paid Hotel ({resource.get_details()})"]]])
+                if error:
+                    self.release_resource(resource, start_dt, end_dt)
+                    return error
+                self.add_hotel_reservation_service(
+                    pet, resource, start_dt, end_dt, price)
+
+            new_reservation = self.add_reservation(
+                service_type, customer, pet, start_dt, end_dt, resource, price, payment_method)
+            self.notify_customer(customer, new_reservation.id)
+            self.__waitlist.remove_pet_entries(pet, service_type)
 
             if service_type.lower() == "hotel":
                 return {
                     "status": "success",
+                    "reservation_id": new_reservation.id,
                     "customer_name": customer.name,
                     "detail": new_reservation.get_details(),
                     "date_start": start_dt.date(),
@@ -1418,15 +3432,111 @@ class Clinic:
             else:
                 return {
                     "status": "success",
+                    "reservation_id": new_reservation.id,
                     "customer_name": customer.name,
                     "detail": new_reservation.get_details(),
                     "time": start_dt,
                     "payment": "Pay Later",
                 }
-        else:
+
+    def create_combo_reservation(self, data: ComboReservationRequest):
+        self.prune_expired_if_due()
+        customer = self.get_customer_info(data.customer_id)
+        if customer == None:
+            return {"status": "fail", "message": "Customer not found"}
+        with customer.lock:
+            pet = customer.get_pet_info(data.pet_id)
+            if pet == None:
+                return {"Status": "Error", "Message": "Pet does not belong to owner"}
+            if not data.items:
+                return {"status": "fail", "message": "Combo reservation requires at least one service"}
+
+            # ตรวจทุกรายการก่อน ยังไม่จองอะไรทั้งนั้น
+            items = []
+            hotel_count = 0
+            for item in data.items:
+                service_type = item.service_type.lower()
+                start_dt, end_dt = self.convert_str_to_time(
+                    item.datetime_start_str, item.datetime_end_str)
+                if start_dt == None or end_dt <= start_dt:
+                    return {
+                        "status": "fail",
+                        "message": f"Invalid datetime for {item.service_type}. Use 'YYYY-MM-DD HH:MM' and end after start.",
+                    }
+                room_type = item.room_type
+                if service_type == "hotel":
+                    hotel_count += 1
+                    room_type, error = self.validate_hotel_reservation(
+                        customer, pet, item.datetime_end_str, room_type, data.payment_method, data.card_id)
+                    if error:
+                        return error
+                elif service_type == "medical":
+                    if item.doctor_id and self.get_doctor_info(item.doctor_id) == None:
+                        return {"status": "fail", "message": "Doctor is not found"}
+                elif service_type != "grooming":
+                    return {"status": "fail", "message": "Service type must be Hotel, Medical or Grooming"}
+                items.append((service_type, start_dt, end_dt,
+                             room_type, item.doctor_id, item))
+
+            if hotel_count > 1:
+                return {"status": "fail", "message": "Combo reservation can include only one hotel stay"}
+
+            # จองทีละรายการ ถ้าล้มเหลวให้คืนทุกอย่างที่จองไปแล้ว
+            allocated = []
+            for service_type, start_dt, end_dt, room_type, doctor_id, item in items:
+                resource = self.allocate_resource(
+                    service_type, start_dt, end_dt, room_type, doctor_id)
+                if resource == None:
+                    for _, booked_start, booked_end, booked_resource in allocated:
+                        self.release_resource(
+                            booked_resource, booked_start, booked_end)
+                    suggestion = self.find_available_slots(
+                        service_type, item.datetime_start_str, item.datetime_end_str, room_type)
+                    return {
+                        "status": "fail",
+                        "message": f"No available resource for {item.service_type} at {start_dt}. Nothing was booked.",
+                        "suggestions": suggestion.get("suggestions", []),
+                    }
+                allocated.append((service_type, start_dt, end_dt, resource))
+
+            price = Money(0)
+            for service_type, start_dt, end_dt, resource in allocated:
+                if service_type == "hotel":
+                    price = self.calculate_hotel_price(resource, start_dt, end_dt)
+                    error = self.prepay_hotel(
+                        customer, data.payment_method, data.card_id, price,
+                        [[pet.name, [f"Pre-paid Hotel ({resource.get_details()})"]]])
+                    if error:
+                        for _, booked_start, booked_end, booked_resource in allocated:
+                            self.release_resource(
+                                booked_resource, booked_start, booked_end)
+                        return error
+                    self.add_hotel_reservation_service(
+                        pet, resource, start_dt, end_dt, price)
+
+            reservation_list = []
+            reservation_ids = []
+            for service_type, start_dt, end_dt, resource in allocated:
+                hotel_price = price if service_type == "hotel" else Money(0)
+                new_reservation = self.add_reservation(
+                    service_type, customer, pet, start_dt, end_dt, resource, hotel_price, data.payment_method)
+                self.__waitlist.remove_pet_entries(pet, service_type)
+                reservation_ids.append(new_reservation.id)
+                reservation_list.append({
+                    "reservation_id": new_reservation.id,
+                    "detail": new_reservation.get_details(),
+                    "time": start_dt,
+                    "time_end": end_dt,
+                    "payment": "PAID" if service_type == "hotel" else "Pay Later",
+                })
+            self.notify_customer(customer, ", ".join(reservation_ids))
+
             return {
-                "status": "fail",
-                "message": f"No available resource for {service_type} at {start_dt}",
+                "status": "success",
+                "customer_name": customer.name,
+                "total_reservations": len(reservation_list),
+                "hotel_prepaid": price.to_baht(),
+                "reservations": reservation_list,
             }
 
     def cancel_reservation(self, customer_id, pet_id, reservation_id):
@@ -1438,42 +3548,55 @@ class Clinic:
         if not pet:
             return {"status": "fail", "message": "Pet not found"}
 
-        for reservation in customer.reservation:
-            if reservation.id == reservation_id:
-                if isinstance(reservation, HotelReservation):
-                    start_dt, end_dt = reservation.get_time_start_and_end
-                    reservation.room.cancel_room(start_dt, end_dt)
-                    for big_service in pet.service:
-                        if big_service.is_paid == False:
-                            service_to_remove = None
-                            for sub_service in big_service.sub_service:
-                                if sub_service.type == "Hotel" and sub_service.is_from_reservation:
-                                    service_to_remove = sub_service
-                                    break
-
-                            if service_to_remove:
-                                big_service.sub_service.remove(
-                                    service_to_remove)
-                                if len(big_service.sub_service) == 0:
-                                    pet.service.remove(big_service)
+        cancelled = None
+        room_type = None
+        with customer.lock:
+            for reservation in customer.reservation:
+                if reservation.id == reservation_id:
+                    cancelled = reservation
+                    break
+
+            if cancelled != None:
+                start_dt, end_dt = cancelled.time, cancelled.time_end
+                if isinstance(cancelled, HotelReservation):
+                    room_type = cancelled.room.room_type
+                    cancelled.room.cancel_room(start_dt, end_dt)
+                    for big_service in pet.unpaid_service:
+                        service_to_remove = None
+                        for sub_service in big_service.sub_service:
+                            if sub_service.type == "Hotel" and sub_service.is_from_reservation:
+                                service_to_remove = sub_service
                                 break
-                elif isinstance(reservation, MedicalReservation):
-                    start_dt, end_dt = reservation.get_time_start_and_end
-                    reservation.doctor.free_timeslot(start_dt, end_dt)
 
-                else:
-                    pass
-                customer.reservation.remove(reservation)
-                return {
-                    "status": "success",
-                    "message": f"Reservation {reservation_id} has been successfully cancelled."
-                }
-        else:
+                        if service_to_remove:
+                            big_service.remove_sub_service(
+                                service_to_remove)
+                            if len(big_service.sub_service) == 0:
+                                pet.remove_big_service(big_service)
+                            break
+                elif isinstance(cancelled, MedicalReservation):
+                    self.release_resource(cancelled.doctor, start_dt, end_dt)
+
+                elif isinstance(cancelled, GroomingReservation):
+                    self.release_resource(cancelled.groomer, start_dt, end_dt)
+                customer.reservation.remove(cancelled)
+                with self.__reservation_lock:
+                    self.__reservation.pop(cancelled.id, None)
+
+        if cancelled == None:
             return {
                 "status": "fail",
                 "message": f"{reservation_id} not found in any reservation in Pet : {pet.name}"
             }
-        pass
+
+        # ปล่อย lock ของลูกค้าก่อน เพราะการเลื่อนคิวจะไปล็อกลูกค้าคนอื่น
+        promoted = self.promote_waitlist(
+            cancelled.Type, room_type, start_dt, end_dt)
+        return {
+            "status": "success",
+            "message": f"Reservation {reservation_id} has been successfully cancelled.",
+            "promoted_from_waitlist": promoted
+        }
 
     def medical_treatment(self, data: TreatmentRequest):
         doctor = self.get_doctor_info(data.doctor_id)
@@ -1484,54 +3607,55 @@ class Clinic:
         if customer == None:
             return {"Status": "Error", "Message": "Customer is not found"}
 
-        pet = customer.get_pet_info(data.petID)
-        if pet == None:
-            return {"Status": "Error", "Message": "Pet does not belong to owner"}
+        with customer.lock:
+            pet = customer.get_pet_info(data.petID)
+            if pet == None:
+                return {"Status": "Error", "Message": "Pet does not belong to owner"}
 
-        medical_service = doctor.create_medical_service(data, self)
+            medical_service = doctor.create_medical_service(data, self)
 
-        unpaid_service = pet.search_unpaid_service()
+            unpaid_service = pet.search_unpaid_service()
 
-        # check unpaid service
-        if unpaid_service:
-            if not unpaid_service.check_has_medical_service():
-                unpaid_service.append_sub_service(medical_service)
-            else:
-                return {"Status": "Error", "Message": "Medical service for today already create"}
+            # check unpaid service
+            if unpaid_service:
+                if not unpaid_service.check_has_medical_service():
+                    unpaid_service.append_sub_service(medical_service)
+                else:
+                    return {"Status": "Error", "Message": "Medical service for today already create"}
 
-        else:
-            # แก้datetimeให้รูปแบบเหมือน hotel service
-            new_big_service = RecordService(datetime.now().strftime(
-                "%Y-%m-%d %H:%M:%S"))  # สร้างกล่องใหญ่
-            new_big_service.append_sub_service(
-                medical_service)  # เพิ่ม sub service ลง
-
-            pet.append_big_service(new_big_service)
-
-        if medical_service.should_admit == True:
-            already_has_room = False
-            for big_srv in pet.service:
-                for sub_srv in big_srv.get_service_list():
-                    if sub_srv == "Hotel":
-                        already_has_room = True
-                        break
+            else:
+                # แก้datetimeให้รูปแบบเหมือน hotel service
+                new_big_service = RecordService(datetime.now().strftime(
+                    "%Y-%m-%d %H:%M:%S"))  # สร้างกล่องใหญ่
+                new_big_service.append_sub_service(
+                    medical_service)  # เพิ่ม sub service ลง
+
+                pet.append_big_service(new_big_service)
+
+            if medical_service.should_admit == True:
+                already_has_room = False
+                for big_srv in pet.unpaid_service:
+                    for sub_srv in big_srv.get_service_list():
+                        if sub_srv == "Hotel":
+                            already_has_room = True
+                            break
                     
-            if not already_has_room:
-                admit_data = AdmitRequest(
-                    doctor_id=data.doctor_id,
-                    petID=data.petID,
-                    type_service="Hotel",
-                )
-                self.start_pet_admit(admit_data)
+                if not already_has_room:
+                    admit_data = AdmitRequest(
+                        doctor_id=data.doctor_id,
+                        petID=data.petID,
+                        type_service="Hotel",
+                    )
+                    self.start_pet_admit(admit_data)
 
-        if isinstance(medical_service, MedicalService):
-            self.__medical_service.append(
-                medical_service)  # keep at Clinic
-            pet.add_medical_record(medical_service)  # keep at Pet
+            if isinstance(medical_service, MedicalService):
+                self.__medical_service.append(
+                    medical_service)  # keep at Clinic
+                pet.add_medical_record(medical_service)  # keep at Pet
 
-            return {"Status": "Success", "Data": medical_service.change_dict()}
-        else:
-            return {"Status": "Error", "Message": medical_service}
+                return {"Status": "Success", "Data": medical_service.change_dict()}
+            else:
+                return {"Status": "Error", "Message": medical_service}
 
     def get_all_medical_record(self):  # object -> dict
         all_med_service = []
@@ -1544,51 +3668,53 @@ class Clinic:
         pet = self.get_pet_info(data.petID)
         if pet == None:
             return {"Status": "Error", "Message": "Pet is not found"}
+        customer = self.get_customer_info(pet.customer_id)
 
-        unpaid_service = pet.search_unpaid_service()
-        has_medical_service = False
+        with customer.lock:
+            unpaid_service = pet.search_unpaid_service()
+            has_medical_service = False
 
-        if unpaid_service:
-            # เช็คว่า service ล่าสุดเป็น medical มั้ย
-            has_medical_service = unpaid_service.check_has_medical_service()
+            if unpaid_service:
+                # เช็คว่า service ล่าสุดเป็น medical มั้ย
+                has_medical_service = unpaid_service.check_has_medical_service()
 
-        if not has_medical_service:
-            return {
-                "status": "Admit is failed",
-                "message": "No active medical service session found for this pet"
-            }
+            if not has_medical_service:
+                return {
+                    "status": "Admit is failed",
+                    "message": "No active medical service session found for this pet"
+                }
 
-        has_admit = unpaid_service.check_has_hotel_admit_service()
-        if has_admit:
-            return {"Status": "Error", "Message": "Admit service for today already create"}
-
-        resource = None
-        time_start = datetime.now().replace(microsecond=0)
-        time_end = time_start + timedelta(days=1)
-        staying_time = 1
-        price = 0
-
-        for room in self.__rooms:
-            if room.room_type == "privateroom":
-                if room.book_room(time_start, time_end):
-                    resource = room
-                    price = room.get_price * staying_time
-                    break
+            has_admit = unpaid_service.check_has_hotel_admit_service()
+            if has_admit:
+                return {"Status": "Error", "Message": "Admit service for today already create"}
 
-        if resource:
-            hotel_service = HotelService(resource, time_start, time_end, price)
-            unpaid_service.append_sub_service(hotel_service)
+            resource = None
+            time_start = datetime.now().replace(microsecond=0)
+            time_end = time_start + timedelta(days=1)
+            staying_time = 1
+            price = Money(0)
 
-            return {
-                "status": "Admit is complete",
-                "message": "Successfully admitted",
-            }
+            for room in self.__rooms:
+                if room.room_type == "privateroom":
+                    if room.book_room(time_start, time_end):
+                        resource = room
+                        price = self.get_room_price(room) * staying_time
+                        break
 
-        else:
-            return {
-                "status": "Admit is failed",
-                "message": "No private room available at the selected time"
-            }
+            if resource:
+                hotel_service = HotelService(resource, time_start, time_end, price)
+                unpaid_service.append_sub_service(hotel_service)
+
+                return {
+                    "status": "Admit is complete",
+                    "message": "Successfully admitted",
+                }
+
+            else:
+                return {
+                    "status": "Admit is failed",
+                    "message": "No private room available at the selected time"
+                }
 
     def search_medical_service_in_customer(self, customer_id, pet_id):
         customer = self.get_customer_info(customer_id)
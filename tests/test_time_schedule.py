@@ -0,0 +1,151 @@
+import random
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from system_class import Doctor, TimeSchedule  # noqa: E402
+
+Base = datetime(2030, 1, 1, 8, 0)
+
+
+def minutes(value):
+    return Base + timedelta(minutes=value)
+
+
+def random_schedule(rng, capacity, count, horizon=600):
+    # จองแบบสุ่ม (นาทีเต็ม) ให้ได้ตารางที่ add_schedule ยอมรับ คืน (schedule, slot ที่จองได้)
+    schedule = TimeSchedule(capacity)
+    booked = []
+    for _ in range(count):
+        start = rng.randint(0, horizon)
+        end = start + rng.randint(1, 120)
+        if schedule.add_schedule(minutes(start), minutes(end)):
+            booked.append((start, end))
+    return schedule, booked
+
+
+def brute_peak(booked, start, end):
+    # นับทีละนาทีว่ามีกี่ slot ใช้งานพร้อมกัน
+    peak = 0
+    for minute in range(start, end):
+        count = sum(1 for s, e in booked if s <= minute < e)
+        peak = max(peak, count)
+    return peak
+
+
+def brute_free_slots(booked, capacity, after, duration, count, horizon):
+    free = []
+    candidate = after
+    while len(free) < count and candidate <= horizon:
+        if brute_peak(booked, candidate, candidate + duration) < capacity:
+            free.append((candidate, candidate + duration))
+            candidate += duration
+        else:
+            candidate += 1
+    return free
+
+
+class TestPeakOccupancy(unittest.TestCase):
+    Trials = 300
+
+    def test_peak_matches_brute_force(self):
+        rng = random.Random(3)
+        for _ in range(self.Trials):
+            capacity = rng.choice([1, 2, 3, 10])
+            schedule, booked = random_schedule(rng, capacity, rng.randint(0, 25))
+            start = rng.randint(0, 650)
+            end = start + rng.randint(1, 150)
+            self.assertEqual(
+                schedule.get_peak_occupancy(minutes(start), minutes(end)),
+                brute_peak(booked, start, end))
+            self.assertEqual(
+                schedule.check_availability(minutes(start), minutes(end)),
+                brute_peak(booked, start, end) < capacity)
+
+    def test_back_to_back_slots_do_not_overlap(self):
+        schedule = TimeSchedule(1)
+        self.assertTrue(schedule.add_schedule(minutes(0), minutes(30)))
+        self.assertTrue(schedule.add_schedule(minutes(30), minutes(60)))
+        self.assertFalse(schedule.add_schedule(minutes(29), minutes(31)))
+
+    def test_find_free_slots_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(self.Trials):
+            capacity = rng.choice([1, 2, 3])
+            schedule, booked = random_schedule(rng, capacity, rng.randint(0, 25))
+            after = rng.randint(0, 600)
+            duration = rng.randint(1, 90)
+            count = rng.randint(1, 3)
+            # ตารางจบไม่เกินนาทีที่ 720 หลังจากนั้นว่างตลอด ไล่ถึง 1000 ก็พอ
+            expected = brute_free_slots(booked, capacity, after, duration, count, 1000)
+            found = schedule.find_free_slots(minutes(after), timedelta(minutes=duration), count)
+            self.assertEqual(
+                found, [(minutes(s), minutes(e)) for s, e in expected])
+
+
+
+class TestCalendarMode(unittest.TestCase):
+    # calendar mode ต้องให้ผลเหมือนเทียบ tuple ตรงๆ ทุกครั้ง แม้เวลาไม่ตรงช่อง 15 นาที
+    Trials = 300
+
+    def test_matches_exact_mode_with_removals(self):
+        rng = random.Random(11)
+        for _ in range(self.Trials):
+            capacity = rng.choice([1, 1, 2, 3])
+            calendar = TimeSchedule(capacity, slot_minutes=15)
+            exact = TimeSchedule(capacity)
+            booked = []
+            for _ in range(30):
+                if rng.random() < 0.05:
+                    now = minutes(rng.randint(0, 600))
+                    self.assertEqual(calendar.prune_before(now), exact.prune_before(now))
+                    booked = [slot for slot in booked if slot[1] > now]
+                    continue
+                if booked and rng.random() < 0.3:
+                    slot = booked.pop(rng.randrange(len(booked)))
+                    self.assertTrue(calendar.remove_schedule(*slot))
+                    self.assertTrue(exact.remove_schedule(*slot))
+                    continue
+                # ครึ่งหนึ่งตรงช่อง 15 นาที บางครั้งยาวข้ามวัน
+                if rng.random() < 0.5:
+                    start = 15 * rng.randint(0, 40)
+                    length = 15 * rng.choice([1, 2, 4, 100])
+                else:
+                    start = rng.randint(0, 600)
+                    length = rng.choice([rng.randint(1, 90), rng.randint(900, 2000)])
+                slot = (minutes(start), minutes(start + length))
+                added = calendar.add_schedule(*slot)
+                self.assertEqual(added, exact.add_schedule(*slot))
+                if added:
+                    booked.append(slot)
+
+    def test_unaligned_back_to_back(self):
+        schedule = TimeSchedule(1, slot_minutes=15)
+        self.assertTrue(schedule.add_schedule(minutes(5), minutes(50)))
+        self.assertTrue(schedule.add_schedule(minutes(50), minutes(90)))
+        self.assertTrue(schedule.add_schedule(minutes(95), minutes(110)))
+        self.assertTrue(schedule.add_schedule(minutes(110), minutes(125)))
+
+    def test_remove_keeps_shared_slot_busy(self):
+        schedule = TimeSchedule(1, slot_minutes=15)
+        self.assertTrue(schedule.add_schedule(minutes(0), minutes(5)))
+        self.assertTrue(schedule.add_schedule(minutes(5), minutes(10)))
+        self.assertTrue(schedule.remove_schedule(minutes(0), minutes(5)))
+        self.assertFalse(schedule.add_schedule(minutes(6), minutes(9)))
+        self.assertTrue(schedule.add_schedule(minutes(0), minutes(5)))
+
+    def test_doctor_schedule_uses_calendar_mode(self):
+        doctor = Doctor("D99", "Test")
+        self.assertEqual(doctor.SlotMinutes, 15)
+        self.assertTrue(doctor.update_timeslot(minutes(125), minutes(170)))
+        self.assertTrue(doctor.update_timeslot(minutes(170), minutes(210)))
+        self.assertFalse(doctor.get_avaliable_work(minutes(160), minutes(175)))
+        self.assertTrue(doctor.free_timeslot(minutes(125), minutes(170)))
+        self.assertTrue(doctor.get_avaliable_work(minutes(125), minutes(170)))
+
+
+if __name__ == "__main__":
+    unittest.main()